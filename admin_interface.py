@@ -6,17 +6,266 @@
 import gradio as gr
 import os
 import json
+import gzip
+import hashlib
+import hmac
 import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import heapq
+from functools import lru_cache
+from operator import itemgetter
+from types import SimpleNamespace
 from typing import Dict, List, Any, Optional
-import matplotlib.pyplot as plt
-import io
-import base64
+import numpy as np
+import orjson
 
 # 統計情報モジュールのインポート
 from usage_statistics import get_usage_statistics
 from affection_system import get_session_manager
 
+@lru_cache(maxsize=1)
+def _cached_stats():
+    return get_usage_statistics()
+
+@lru_cache(maxsize=1)
+def _cached_sessions():
+    return get_session_manager()
+
+def _stats():
+    """統計情報モジュールのインスタンスを取得する（初期化後は使い回す）"""
+    stats = _cached_stats()
+    if stats is None:
+        # 未初期化の状態はキャッシュしない
+        _cached_stats.cache_clear()
+    return stats
+
+def _sessions():
+    """セッションマネージャーを取得する（初期化後は使い回す）"""
+    session_manager = _cached_sessions()
+    if session_manager is None:
+        # 未初期化の状態はキャッシュしない
+        _cached_sessions.cache_clear()
+    return session_manager
+
+def reset_admin_caches() -> None:
+    """
+    管理者画面が保持しているキャッシュをすべて破棄する
+    
+    統計情報・セッションマネージャーを再初期化した後に呼び出す
+    """
+    global _SESSIONS_CACHE
+    _cached_stats.cache_clear()
+    _cached_sessions.cache_clear()
+    _STATS_CACHE.clear()
+    _SESSIONS_CACHE = None
+
+def _to_json_text(data: Any) -> str:
+    """
+    表示用にJSON文字列へ整形する
+    
+    Args:
+        data: 変換するデータ
+        
+    Returns:
+        インデント付きのJSON文字列
+    """
+    return orjson.dumps(
+        data,
+        option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS,
+        default=str
+    ).decode("utf-8")
+
+# 統計情報キャッシュの有効期間（秒）
+STATS_CACHE_TTL = 60
+
+# 期間ごとの統計情報キャッシュ {period: (timestamp, summary, daily_image, hourly_image)}
+_STATS_CACHE: Dict[str, tuple] = {}
+
+# セッション一覧に表示する最大件数
+MAX_SESSION_LIST = 200
+# 会話履歴の既定の表示件数
+DEFAULT_HISTORY_TAIL = 200
+# セッション一覧キャッシュの有効期間（秒）
+SESSIONS_CACHE_TTL = 10
+# セッション一覧のキャッシュ (timestamp, session_ids)
+_SESSIONS_CACHE: Optional[tuple] = None
+
+@lru_cache(maxsize=4096)
+def _parse_iso(timestamp: str) -> datetime:
+    """ISO形式の日時文字列を解釈する（更新のたびに同じ文字列を解釈し直さないようキャッシュする）"""
+    return datetime.fromisoformat(timestamp)
+
+def _normalize_export_date(value: Optional[str]) -> Optional[str]:
+    """
+    エクスポート期間の日付を検証してYYYY-MM-DD形式に揃える
+    
+    Args:
+        value: 入力された日付（空欄はNone扱い）
+        
+    Returns:
+        YYYY-MM-DD形式の日付、空欄の場合はNone
+        
+    Raises:
+        ValueError: 日付として解釈できない場合
+    """
+    if value is None or not str(value).strip():
+        return None
+    return datetime.strptime(str(value).strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+
+# 統計情報の取得に使うスレッドプール
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="admin-stats")
+
+def _fetch_statistics(stats, days: int) -> tuple:
+    """
+    基本統計情報・日別ユーザー数・時間帯別分布を並行して取得する
+    
+    並行取得に失敗した場合は順番に取得し直す
+    
+    Args:
+        stats: UsageStatisticsインスタンス
+        days: 日別ユーザー数の取得日数
+        
+    Returns:
+        Tuple of (summary, daily_users, hourly_distribution)
+    """
+    try:
+        f1 = _EXECUTOR.submit(stats.get_summary_statistics)
+        f2 = _EXECUTOR.submit(stats.get_daily_users, days)
+        f3 = _EXECUTOR.submit(stats.get_hourly_distribution)
+        return f1.result(), f2.result(), f3.result()
+    except Exception as e:
+        logging.warning(f"統計情報の並行取得に失敗したため順番に取得します: {str(e)}")
+        return (
+            stats.get_summary_statistics(),
+            stats.get_daily_users(days),
+            stats.get_hourly_distribution()
+        )
+
+@lru_cache(maxsize=None)
+def _mpl() -> SimpleNamespace:
+    """
+    matplotlibを初回のグラフ描画時に読み込む
+    
+    管理者画面を使わないプロセスでは読み込みのコストがかからない
+    
+    Returns:
+        Figure, FigureCanvasAgg, MaxNLocator を持つ名前空間
+    """
+    import matplotlib
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.ticker import MaxNLocator
+    
+    # グラフ用フォント設定（日本語ラベル用のフォールバックを含む）は一度だけ行う
+    matplotlib.rcParams['font.family'] = 'sans-serif'
+    matplotlib.rcParams['font.sans-serif'] = ['Noto Sans CJK JP', 'IPAexGothic', 'Yu Gothic', 'Meiryo'] + matplotlib.rcParams['font.sans-serif']
+    
+    return SimpleNamespace(Figure=Figure, FigureCanvasAgg=FigureCanvasAgg, MaxNLocator=MaxNLocator)
+
+# チャート枠ごとに使い回す図 {slot: (figure, axes)}
+_FIGURES: Dict[Any, tuple] = {}
+_FIGURE_LOCK = threading.Lock()
+# チャート枠ごとに最後に描画したデータと画像 {slot: ((labels, counts), image)}
+_FIG_MEMO: Dict[Any, tuple] = {}
+
+def _get_figure(slot: Any) -> tuple:
+    """
+    チャート枠ごとの図を取得し、描画前に軸をクリアする
+    
+    呼び出し側で _FIGURE_LOCK を保持していること
+    
+    Args:
+        slot: チャート枠の識別子
+        
+    Returns:
+        Tuple of (figure, axes)
+    """
+    if slot not in _FIGURES:
+        # pyplotのグローバル状態を使わず、Aggキャンバス付きの図を直接作る
+        mpl = _mpl()
+        fig = mpl.Figure(figsize=(10, 6))
+        mpl.FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        # tight_layoutの代わりに固定の余白を使う
+        fig.subplots_adjust(left=0.08, right=0.97, top=0.92, bottom=0.18)
+        _FIGURES[slot] = (fig, ax)
+    
+    fig, ax = _FIGURES[slot]
+    ax.cla()
+    return fig, ax
+
+def _get_memoized_image(slot: Any, data_key: tuple) -> Optional[np.ndarray]:
+    """
+    同じデータで描画済みの画像があれば返す
+    
+    呼び出し側で _FIGURE_LOCK を保持していること
+    
+    Args:
+        slot: チャート枠の識別子
+        data_key: 描画するデータ（ラベルと値のタプル）
+        
+    Returns:
+        描画済みの画像、なければNone
+    """
+    memo = _FIG_MEMO.get(slot)
+    if memo is not None and memo[0] == data_key:
+        return memo[1]
+    return None
+
+def _render_figure(slot: Any, fig, data_key: tuple) -> np.ndarray:
+    """
+    図を画像に描画し、データとともに記録する
+    
+    図はチャート枠ごとに使い回すため、Gradioには図そのものではなく
+    描画済みの画像（読み取り専用のコピー）を渡す。ロックを外した後に
+    別のリクエストが図を描き直しても、返した画像やキャッシュは変わらない。
+    
+    呼び出し側で _FIGURE_LOCK を保持していること
+    
+    Args:
+        slot: チャート枠の識別子
+        fig: 描画する図
+        data_key: 描画したデータ（ラベルと値のタプル）
+        
+    Returns:
+        RGBA画像の配列
+    """
+    fig.canvas.draw()
+    image = np.array(fig.canvas.buffer_rgba())
+    image.setflags(write=False)
+    _FIG_MEMO[slot] = (data_key, image)
+    return image
+
+def _rotate_xticklabels(ax) -> None:
+    """X軸ラベルを45度回転して右寄せにする"""
+    ax.tick_params(axis='x', labelrotation=45)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+
+# 時間帯ラベル（0時〜23時）
+_HOUR_LABELS = [f"{h}時" for h in range(24)]
+
+def _warm_matplotlib() -> None:
+    """
+    matplotlibの読み込みとフォントの解決を事前に済ませる
+    
+    初回のグラフ描画（画面を開いた直後の統計表示）が遅くならないようにする
+    """
+    try:
+        mpl = _mpl()
+        fig = mpl.Figure(figsize=(1, 1))
+        canvas = mpl.FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        ax.bar(["0時"], [0])
+        ax.set_title('ウォームアップ')
+        canvas.draw()
+    except Exception as e:
+        logging.warning(f"matplotlibの事前読み込みに失敗しました: {str(e)}")
+
 def create_admin_interface():
     """
     管理者インターフェースを作成
@@ -24,6 +273,10 @@ def create_admin_interface():
     Returns:
         Gradioインターフェース
     """
+    # グラフ描画の準備をバックグラウンドで進めておく（MARI_WARM_MPL=0で無効）
+    if os.environ.get("MARI_WARM_MPL") != "0":
+        threading.Thread(target=_warm_matplotlib, name="admin-mpl-warmup", daemon=True).start()
+    
     with gr.Blocks(title="麻理AI管理者パネル", theme=gr.themes.Soft()) as admin_interface:
         gr.Markdown("# 麻理AI管理者パネル")
         
@@ -39,16 +292,21 @@ def create_admin_interface():
                         label="期間"
                     )
                     
-                    # 統計情報更新ボタン
+                    # 統計情報更新ボタン（有効期間内はキャッシュを表示）
                     refresh_btn = gr.Button("統計情報を更新", variant="primary")
+                    # キャッシュを無視して再計算するボタン
+                    force_refresh_btn = gr.Button("再計算", size="sm")
                     
                     # 基本統計情報
-                    summary_stats = gr.JSON(label="基本統計情報")
+                    summary_stats = gr.Code(label="基本統計情報", language="json")
+                    
+                    # このクライアントに表示済みの統計情報キャッシュ
+                    stats_rendered = gr.State(None)
                     
                 with gr.Column(scale=2):
                     # グラフ表示
-                    daily_users_chart = gr.Plot(label="日別ユニークユーザー数")
-                    hourly_distribution_chart = gr.Plot(label="時間帯別アクティビティ")
+                    daily_users_chart = gr.Image(label="日別ユニークユーザー数", type="numpy", format="png", interactive=False)
+                    hourly_distribution_chart = gr.Image(label="時間帯別アクティビティ", type="numpy", format="png", interactive=False)
             
             with gr.Row():
                 # データエクスポート
@@ -75,10 +333,19 @@ def create_admin_interface():
                     # セッション一覧
                     session_list = gr.Dropdown(label="アクティブセッション")
                     load_sessions_btn = gr.Button("セッション一覧を更新")
+                    
+                    # 会話履歴の表示件数（最新から）
+                    history_tail = gr.Slider(
+                        minimum=50,
+                        maximum=2000,
+                        value=DEFAULT_HISTORY_TAIL,
+                        step=50,
+                        label="会話履歴の表示件数"
+                    )
                 
                 with gr.Column(scale=2):
                     # ユーザー情報表示
-                    user_info = gr.JSON(label="ユーザー情報")
+                    user_info = gr.Code(label="ユーザー情報", language="json")
                     
                     # 会話履歴表示
                     conversation_history = gr.Dataframe(
@@ -87,20 +354,32 @@ def create_admin_interface():
                     )
         
         # 関数定義
-        def update_statistics(period):
+        def update_statistics(period, rendered=None, force=False):
             """
             統計情報を更新
             
             Args:
                 period: 表示期間
+                rendered: このクライアントに表示済みのキャッシュ (period, timestamp)
+                force: Trueの場合はキャッシュを無視して再計算する
                 
             Returns:
-                Tuple of (summary_stats, daily_users_chart, hourly_distribution_chart)
+                Tuple of (summary_stats, daily_users_chart, hourly_distribution_chart, rendered)
             """
+            # 有効期間内のキャッシュがあれば再計算せずに返す
+            cached = _STATS_CACHE.get(period)
+            if not force and cached and time.monotonic() - cached[0] < STATS_CACHE_TTL:
+                rendered_key = (period, cached[0])
+                if rendered == rendered_key:
+                    # 表示済みの内容と同じなので何も送らない
+                    return gr.update(), gr.update(), gr.update(), rendered
+                return (*cached[1:], rendered_key)
+            
             try:
-                stats = get_usage_statistics()
+                stats = _stats()
                 if not stats:
-                    return {"error": "統計情報モジュールが初期化されていません"}, None, None
+                    # 表示中のグラフはそのまま残す
+                    return _to_json_text({"error": "統計情報モジュールが初期化されていません"}), gr.update(), gr.update(), None
                 
                 # 期間に応じた日数を設定
                 days = {
@@ -110,63 +389,79 @@ def create_admin_interface():
                     "全期間": 365  # 最大1年
                 }.get(period, 30)
                 
-                # 基本統計情報を取得
-                summary = stats.get_summary_statistics()
-                
-                # 日別ユーザー数を取得
-                daily_users = stats.get_daily_users(days)
-                
-                # 時間帯別分布を取得
-                hourly_distribution = stats.get_hourly_distribution()
+                # 基本統計情報・日別ユーザー数・時間帯別分布を並行して取得
+                summary, daily_users, hourly_distribution = _fetch_statistics(stats, days)
                 
                 # 日別ユーザー数のグラフを作成
-                daily_fig = create_daily_users_chart(daily_users)
+                daily_image = create_daily_users_chart(daily_users, days)
                 
                 # 時間帯別分布のグラフを作成
-                hourly_fig = create_hourly_distribution_chart(hourly_distribution)
+                hourly_image = create_hourly_distribution_chart(hourly_distribution)
                 
-                return summary, daily_fig, hourly_fig
+                summary_text = _to_json_text(summary)
+                cached_at = time.monotonic()
+                _STATS_CACHE[period] = (cached_at, summary_text, daily_image, hourly_image)
+                return summary_text, daily_image, hourly_image, (period, cached_at)
                 
             except Exception as e:
                 logging.error(f"統計情報の更新に失敗しました: {str(e)}")
-                return {"error": f"統計情報の更新に失敗しました: {str(e)}"}, None, None
+                # 表示中のグラフはそのまま残す
+                return _to_json_text({"error": f"統計情報の更新に失敗しました: {str(e)}"}), gr.update(), gr.update(), None
+        
+        def refresh_statistics(period, rendered=None):
+            """
+            キャッシュを無視して統計情報を更新（再計算ボタン用）
+            
+            Args:
+                period: 表示期間
+                rendered: このクライアントに表示済みのキャッシュ
+                
+            Returns:
+                Tuple of (summary_stats, daily_users_chart, hourly_distribution_chart, rendered)
+            """
+            # 統計情報モジュールの再初期化にも追従できるよう、保持しているキャッシュをすべて破棄する
+            reset_admin_caches()
+            return update_statistics(period, rendered, force=True)
         
-        def create_daily_users_chart(daily_users):
+        def create_daily_users_chart(daily_users, days=30):
             """
             日別ユーザー数のグラフを作成
             
             Args:
                 daily_users: 日別ユーザー数の辞書
+                days: 表示日数（期間ごとに図を使い回すためのキー）
                 
             Returns:
-                matplotlib図
+                グラフのRGBA画像
             """
-            fig, ax = plt.subplots(figsize=(10, 6))
-            
-            dates = list(daily_users.keys())
-            counts = list(daily_users.values())
+            # get_daily_users は日付の昇順で返すので並べ替えは不要
+            sorted_dates = list(daily_users.keys())
+            sorted_counts = list(daily_users.values())
             
-            # 日付でソート
-            sorted_data = sorted(zip(dates, counts), key=lambda x: x[0])
-            sorted_dates = [item[0] for item in sorted_data]
-            sorted_counts = [item[1] for item in sorted_data]
+            slot = ("daily", days)
+            data_key = (tuple(sorted_dates), tuple(sorted_counts))
             
-            ax.bar(sorted_dates, sorted_counts, color='skyblue')
-            ax.set_xlabel('日付')
-            ax.set_ylabel('ユニークユーザー数')
-            ax.set_title('日別ユニークユーザー数')
-            
-            # X軸の日付ラベルを調整
-            if len(sorted_dates) > 10:
-                plt.xticks(rotation=45, ha='right')
-                # 日付ラベルを間引く
-                step = max(1, len(sorted_dates) // 10)
-                for i, label in enumerate(ax.xaxis.get_ticklabels()):
-                    if i % step != 0:
-                        label.set_visible(False)
-            
-            plt.tight_layout()
-            return fig
+            with _FIGURE_LOCK:
+                # データが前回と同じなら描画し直さない
+                image = _get_memoized_image(slot, data_key)
+                if image is not None:
+                    return image
+                
+                # 期間ごとに別の図を使うので、キャッシュ済みの図が上書きされない
+                fig, ax = _get_figure(slot)
+                
+                ax.bar(sorted_dates, sorted_counts, color='skyblue')
+                ax.set_xlabel('日付')
+                ax.set_ylabel('ユニークユーザー数')
+                ax.set_title('日別ユニークユーザー数')
+                
+                # X軸の日付ラベルを調整
+                if len(sorted_dates) > 10:
+                    # 日付ラベルを間引く
+                    ax.xaxis.set_major_locator(_mpl().MaxNLocator(nbins=10, integer=True))
+                    _rotate_xticklabels(ax)
+                
+                return _render_figure(slot, fig, data_key)
         
         def create_hourly_distribution_chart(hourly_distribution):
             """
@@ -176,32 +471,39 @@ def create_admin_interface():
                 hourly_distribution: 時間帯別分布の辞書
                 
             Returns:
-                matplotlib図
+                グラフのRGBA画像
             """
-            fig, ax = plt.subplots(figsize=(10, 6))
-            
-            hours = [int(h) for h in hourly_distribution.keys()]
-            counts = list(hourly_distribution.values())
-            
-            # 時間でソート
-            sorted_data = sorted(zip(hours, counts))
-            sorted_hours = [f"{item[0]}時" for item in sorted_data]
-            sorted_counts = [item[1] for item in sorted_data]
+            # 0〜23時の固定長の配列にまとめて加算する
+            n = len(hourly_distribution)
+            hours = np.fromiter((int(h) for h in hourly_distribution.keys()), dtype=np.int64, count=n)
+            values = np.fromiter(hourly_distribution.values(), dtype=np.int64, count=n)
+            valid = (hours >= 0) & (hours < 24)
+            counts = np.zeros(24, dtype=np.int64)
+            np.add.at(counts, hours[valid], values[valid])
             
-            ax.bar(sorted_hours, sorted_counts, color='lightgreen')
-            ax.set_xlabel('時間帯')
-            ax.set_ylabel('アクティビティ数')
-            ax.set_title('時間帯別アクティビティ分布')
+            sorted_hours = _HOUR_LABELS
+            sorted_counts = counts.tolist()
             
-            plt.xticks(rotation=45, ha='right')
-            # 時間ラベルを間引く
-            step = max(1, len(sorted_hours) // 12)
-            for i, label in enumerate(ax.xaxis.get_ticklabels()):
-                if i % step != 0:
-                    label.set_visible(False)
+            data_key = (tuple(sorted_hours), tuple(sorted_counts))
             
-            plt.tight_layout()
-            return fig
+            with _FIGURE_LOCK:
+                # データが前回と同じなら描画し直さない
+                image = _get_memoized_image("hourly", data_key)
+                if image is not None:
+                    return image
+                
+                fig, ax = _get_figure("hourly")
+                
+                ax.bar(sorted_hours, sorted_counts, color='lightgreen')
+                ax.set_xlabel('時間帯')
+                ax.set_ylabel('アクティビティ数')
+                ax.set_title('時間帯別アクティビティ分布')
+                
+                # 時間ラベルを間引く
+                ax.xaxis.set_major_locator(_mpl().MaxNLocator(nbins=12, integer=True))
+                _rotate_xticklabels(ax)
+                
+                return _render_figure("hourly", fig, data_key)
         
         def export_data(start_date, end_date):
             """
@@ -212,81 +514,129 @@ def create_admin_interface():
                 end_date: 終了日
                 
             Returns:
-                CSVファイル
+                gzip圧縮したCSVファイル
             """
+            temp_path = None
             try:
-                stats = get_usage_statistics()
+                stats = _stats()
                 if not stats:
                     return None
                 
-                csv_data = stats.export_data_csv(start_date, end_date)
+                # 日付はファイルを作る前に検証し、YYYY-MM-DD形式に揃える
+                try:
+                    start_date = _normalize_export_date(start_date)
+                    end_date = _normalize_export_date(end_date)
+                except ValueError:
+                    logging.warning(f"エクスポートの日付が不正です: {start_date!r} - {end_date!r}")
+                    return None
+                
+                # 空欄は export_data_csv_to と同じ既定の期間（終了日は今日、開始日はその30日前）にする
+                if not end_date:
+                    end_date = datetime.now().strftime("%Y-%m-%d")
+                if not start_date:
+                    start_date = (datetime.strptime(end_date, "%Y-%m-%d") - timedelta(days=30)).strftime("%Y-%m-%d")
                 
-                # CSVファイルを作成
-                filename = f"mari_stats_{start_date}_to_{end_date}.csv"
-                temp_path = os.path.join(os.path.dirname(__file__), filename)
+                # gzip圧縮したCSVファイルを一時ディレクトリに作成し、直接書き出す
+                # （圧縮レベル1で速度を優先する）
+                with tempfile.NamedTemporaryFile(
+                    mode='wb', buffering=1 << 20,
+                    prefix=f"mari_stats_{start_date}_{end_date}_", suffix='.csv.gz',
+                    delete=False
+                ) as raw:
+                    temp_path = raw.name
+                    with gzip.open(raw, 'wt', compresslevel=1, encoding='utf-8', newline='') as f:
+                        ok = stats.export_data_csv_to(start_date, end_date, f)
                 
-                with open(temp_path, 'w', encoding='utf-8') as f:
-                    f.write(csv_data)
+                if not ok:
+                    os.unlink(temp_path)
+                    return None
                 
                 return temp_path
                 
             except Exception as e:
                 logging.error(f"データのエクスポートに失敗しました: {str(e)}")
+                # 書きかけの一時ファイルを残さない
+                if temp_path and os.path.exists(temp_path):
+                    os.unlink(temp_path)
                 return None
         
-        def load_sessions():
+        def load_sessions(force=False):
             """
             アクティブなセッション一覧を読み込む
             
+            Args:
+                force: Trueの場合はキャッシュを無視して再取得する
+                
             Returns:
                 セッションIDのリスト
             """
+            global _SESSIONS_CACHE
+            
+            # 有効期間内のキャッシュがあれば再取得せずに返す
+            cached = _SESSIONS_CACHE
+            if not force and cached and time.monotonic() - cached[0] < SESSIONS_CACHE_TTL:
+                return cached[1]
+            
             try:
-                session_manager = get_session_manager()
+                session_manager = _sessions()
                 if not session_manager:
                     return []
                 
-                session_ids = session_manager.list_sessions()
+                # セッションIDと最終アクセス日時を一括で取得
+                entries = session_manager.list_sessions_with_last_interaction()
                 
-                # セッション情報を取得して、最終アクセス日時でソート
+                # 日時を解釈できないセッションは最も古い扱いにして末尾に並べる
                 session_info = []
-                for session_id in session_ids:
-                    session = session_manager.get_session(session_id)
-                    if session:
-                        try:
-                            last_interaction = datetime.fromisoformat(session.last_interaction)
-                            session_info.append((session_id, last_interaction))
-                        except (ValueError, TypeError):
-                            session_info.append((session_id, datetime.min))
-                
-                # 最終アクセス日時の新しい順にソート
-                sorted_sessions = sorted(session_info, key=lambda x: x[1], reverse=True)
+                for session_id, last_interaction in entries:
+                    try:
+                        session_info.append((session_id, _parse_iso(last_interaction)))
+                    except (ValueError, TypeError):
+                        session_info.append((session_id, datetime.min))
+                
+                # 最終アクセス日時の新しい順に上位のみ取り出す
+                sorted_sessions = heapq.nlargest(MAX_SESSION_LIST, session_info, key=itemgetter(1))
                 
                 # セッションIDのみを返す
-                return [session_id for session_id, _ in sorted_sessions]
+                session_ids = [session_id for session_id, _ in sorted_sessions]
+                _SESSIONS_CACHE = (time.monotonic(), session_ids)
+                return session_ids
                 
             except Exception as e:
                 logging.error(f"セッション一覧の読み込みに失敗しました: {str(e)}")
                 return []
         
-        def load_user_info(session_id):
+        def refresh_sessions():
+            """
+            キャッシュを無視してセッション一覧を読み込む
+            
+            Returns:
+                セッションIDのリスト
+            """
+            return load_sessions(force=True)
+        
+        def load_user_info(session_id, tail=DEFAULT_HISTORY_TAIL):
             """
             ユーザー情報を読み込む
             
             Args:
                 session_id: セッションID
+                tail: 表示する会話履歴の件数（最新から）
                 
             Returns:
                 Tuple of (user_info, conversation_history)
             """
             try:
-                session_manager = get_session_manager()
-                if not session_manager or not session_id:
-                    return {}, []
+                # セッションIDが空の場合は表示中の内容をそのまま残す
+                if not session_id:
+                    return gr.update(), gr.update()
+                
+                session_manager = _sessions()
+                if not session_manager:
+                    return _to_json_text({}), []
                 
                 session = session_manager.get_session(session_id)
                 if not session:
-                    return {"error": f"セッション {session_id} が見つかりません"}, []
+                    return _to_json_text({"error": f"セッション {session_id} が見つかりません"}), []
                 
                 # ユーザー情報を取得
                 user_info = {
@@ -300,27 +650,43 @@ def create_admin_interface():
                 if hasattr(session, "user_metadata") and session.user_metadata:
                     user_info["user_metadata"] = session.user_metadata
                 
-                # 会話履歴を取得
-                conversation_data = []
-                for entry in session.conversation_history:
-                    if 'timestamp' in entry and 'user' in entry and 'assistant' in entry:
-                        conversation_data.append([
-                            entry['timestamp'],
-                            entry['user'],
-                            entry['assistant']
-                        ])
+                # 会話履歴を取得（時間・ユーザー・アシスタントが揃った項目のみ）
+                history = session.conversation_history
+                tail = int(tail) if tail else DEFAULT_HISTORY_TAIL
+                conversation_data = [
+                    [entry['timestamp'], entry['user'], entry['assistant']]
+                    for entry in history[-tail:]
+                    if 'timestamp' in entry and 'user' in entry and 'assistant' in entry
+                ]
                 
-                return user_info, conversation_data
+                # 表示件数の注記
+                user_info["conversation_count"] = len(history)
+                user_info["conversation_shown"] = len(conversation_data)
+                
+                return _to_json_text(user_info), conversation_data
                 
             except Exception as e:
                 logging.error(f"ユーザー情報の読み込みに失敗しました: {str(e)}")
-                return {"error": f"ユーザー情報の読み込みに失敗しました: {str(e)}"}, []
+                return _to_json_text({"error": f"ユーザー情報の読み込みに失敗しました: {str(e)}"}), []
         
         # イベントハンドラの設定
         refresh_btn.click(
             update_statistics,
-            inputs=[period_selector],
-            outputs=[summary_stats, daily_users_chart, hourly_distribution_chart]
+            inputs=[period_selector, stats_rendered],
+            outputs=[summary_stats, daily_users_chart, hourly_distribution_chart, stats_rendered]
+        )
+        
+        # 期間を変えたらボタンを押さなくても表示を切り替える
+        period_selector.change(
+            update_statistics,
+            inputs=[period_selector, stats_rendered],
+            outputs=[summary_stats, daily_users_chart, hourly_distribution_chart, stats_rendered]
+        )
+        
+        force_refresh_btn.click(
+            refresh_statistics,
+            inputs=[period_selector, stats_rendered],
+            outputs=[summary_stats, daily_users_chart, hourly_distribution_chart, stats_rendered]
         )
         
         export_btn.click(
@@ -330,28 +696,28 @@ def create_admin_interface():
         )
         
         load_sessions_btn.click(
-            load_sessions,
+            refresh_sessions,
             inputs=[],
             outputs=[session_list]
         )
         
         search_btn.click(
             load_user_info,
-            inputs=[session_id_input],
+            inputs=[session_id_input, history_tail],
             outputs=[user_info, conversation_history]
         )
         
         session_list.change(
             load_user_info,
-            inputs=[session_list],
+            inputs=[session_list, history_tail],
             outputs=[user_info, conversation_history]
         )
         
         # 初期データ読み込み
         admin_interface.load(
             update_statistics,
-            inputs=[period_selector],
-            outputs=[summary_stats, daily_users_chart, hourly_distribution_chart]
+            inputs=[period_selector, stats_rendered],
+            outputs=[summary_stats, daily_users_chart, hourly_distribution_chart, stats_rendered]
         )
         
         admin_interface.load(
@@ -362,6 +728,10 @@ def create_admin_interface():
     
     return admin_interface
 
+# 管理者認証情報（環境変数から起動時に一度だけ読み込み、パスワードはハッシュで保持）
+_ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin").encode("utf-8")
+_ADMIN_PASSWORD_HASH = hashlib.sha256(os.environ.get("ADMIN_PASSWORD", "password").encode("utf-8")).digest()
+
 # 管理者認証
 def check_admin_auth(username, password):
     """
@@ -374,8 +744,9 @@ def check_admin_auth(username, password):
     Returns:
         認証成功の場合はTrue、失敗の場合はFalse
     """
-    # 環境変数から管理者認証情報を取得
-    admin_username = os.environ.get("ADMIN_USERNAME", "admin")
-    admin_password = os.environ.get("ADMIN_PASSWORD", "password")
+    username_ok = hmac.compare_digest((username or "").encode("utf-8"), _ADMIN_USERNAME)
+    password_hash = hashlib.sha256((password or "").encode("utf-8")).digest()
+    password_ok = hmac.compare_digest(password_hash, _ADMIN_PASSWORD_HASH)
     
-    return username == admin_username and password == admin_password
\ No newline at end of file
+    # 短絡評価で比較時間に差が出ないよう、両方を比較してから判定する
+    return bool(username_ok & password_ok)
\ No newline at end of file
@@ -4,29 +4,73 @@ Handles affection tracking, session management, and data persistence for Mari AI
 """
 
 import uuid
+from functools import lru_cache, partial
+from collections import OrderedDict, defaultdict, deque
+import bisect
 import os
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Tuple
+from datetime import datetime
+import heapq
+from itertools import islice
+from operator import itemgetter
+from types import MappingProxyType
+from typing import Dict, List, Optional, Any, Tuple, Mapping
 import logging
+import threading
+import atexit
+import time
 
 # Import sentiment analyzer and session storage
 from sentiment_analyzer import SentimentAnalyzer, SentimentAnalysisResult
 from session_storage import SessionStorage, UserSession
 
+logger = logging.getLogger(__name__)
+
+# Lock stripes guarding per-session mutations. Sessions hash onto one of 64
+# reentrant locks, so concurrent turns for different sessions rarely contend.
+_SESSION_STRIPES = tuple(threading.RLock() for _ in range(64))
+
+# How long the background writer waits to coalesce snapshot saves (seconds)
+SAVE_DEBOUNCE_INTERVAL = 0.1
+
+_MINUTE_NS = 60 * 1_000_000_000
+
+# Sentiment results are cached for short inputs only; long messages rarely repeat
+SENTIMENT_CACHE_SIZE = 2048
+SENTIMENT_CACHE_MAX_INPUT = 128
+
+# Number of sentiment history entries kept per session
+SENTIMENT_HISTORY_SIZE = 64
+
+def _stripe_of(session_id: str) -> threading.RLock:
+    """Get the lock stripe guarding a session"""
+    return _SESSION_STRIPES[hash(session_id) & 63]
+
 class SessionManager:
     """Manages user sessions and affection tracking"""
     
-    def __init__(self, storage_dir: str = "sessions"):
+    def __init__(self, storage_dir: str = "sessions", max_cached_sessions: int = 1024):
         """
         Initialize session manager with storage
         
         Args:
             storage_dir: Directory path for storing session files
+            max_cached_sessions: Maximum number of sessions kept in memory (least recently used are evicted)
         """
         self.storage = SessionStorage(storage_dir)
-        self.current_sessions: Dict[str, UserSession] = {}
+        self.current_sessions: "OrderedDict[str, UserSession]" = OrderedDict()
+        self._max_cache = max_cached_sessions
+        self._cache_lock = threading.RLock()  # Guards the ordering of current_sessions
         self.storage_dir = storage_dir
-        logging.info(f"Session manager initialized with storage directory: {storage_dir}")
+        
+        # Snapshot saves are queued here and written at most once per drain
+        self._dirty: Dict[str, UserSession] = {}
+        # Sessions evicted from the cache whose snapshot has not been written yet
+        self._evicted: Dict[str, UserSession] = {}
+        self._dirty_cv = threading.Condition()
+        self._writer = threading.Thread(target=self._writer_loop, name="session-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+        logger.info("Session manager initialized with storage directory: %s", storage_dir)
     
     def generate_session_id(self) -> str:
         """Generate a unique session ID"""
@@ -54,10 +98,12 @@ class SessionManager:
             last_interaction=current_time
         )
         
-        self.current_sessions[session_id] = session
-        self.save_session(session_id)
+        with _stripe_of(session_id):
+            evicted = self._cache_session(session)
+            self._save_session_obj(session)
+        self._save_evicted(evicted)
         
-        logging.info(f"Created new session: {session_id} with affection level {session.affection_level}")
+        logger.info("Created new session: %s with affection level %d", session_id, session.affection_level)
         return session_id
     
     def get_session(self, session_id: str) -> Optional[UserSession]:
@@ -71,18 +117,76 @@ class SessionManager:
             UserSession object if found, None otherwise
         """
         # First check if session is in memory
-        if session_id in self.current_sessions:
-            return self.current_sessions[session_id]
+        with self._cache_lock:
+            session = self.current_sessions.get(session_id)
+            if session is not None:
+                self.current_sessions.move_to_end(session_id)
+                return session
+        
+        # Try to load from storage; the stripe lock keeps two threads from
+        # loading the same session twice
+        with _stripe_of(session_id):
+            with self._cache_lock:
+                session = self.current_sessions.get(session_id)
+            if session is not None:
+                return session
+            
+            # An evicted copy still waiting for the writer is newer than the one on disk
+            with self._dirty_cv:
+                session = self._evicted.pop(session_id, None)
+            if session is not None:
+                self._save_session_obj(session)
+            else:
+                session = self.storage.load_session(session_id)
+            if not session:
+                return None
+            evicted = self._cache_session(session)
+        
+        self._save_evicted(evicted)
+        return session
+    
+    def _cache_session(self, session: UserSession) -> List[UserSession]:
+        """
+        Put a session in the memory cache, evicting the least recently used ones
+        
+        Args:
+            session: Session to cache
+            
+        Returns:
+            Evicted sessions; pass them to _save_evicted
+        """
+        evicted_sessions = []
+        with self._cache_lock:
+            self.current_sessions[session.user_id] = session
+            self.current_sessions.move_to_end(session.user_id)
+            
+            while len(self.current_sessions) > self._max_cache:
+                evicted_sessions.append(self.current_sessions.popitem(last=False)[1])
         
-        # Try to load from storage
-        session = self.storage.load_session(session_id)
-        if session:
-            self.current_sessions[session_id] = session
-            return session
+        return evicted_sessions
+    
+    def _save_evicted(self, evicted_sessions: List[UserSession]) -> None:
+        """
+        Queue evicted sessions for a full snapshot so nothing held only in memory is lost
         
-        return None
+        The snapshot is written by the background writer, which takes the
+        session's stripe lock without holding any other, so the caller never
+        waits on another session's lock. Until then get_session picks the
+        queued copy up again instead of reading the older one from disk.
+        
+        Args:
+            evicted_sessions: Sessions removed from the memory cache
+        """
+        if not evicted_sessions:
+            return
+        
+        with self._dirty_cv:
+            for evicted in evicted_sessions:
+                self._evicted[evicted.user_id] = evicted
+                logger.debug("Evicted session %s from memory cache", evicted.user_id)
+            self._dirty_cv.notify()
     
-    def update_affection(self, session_id: str, delta: int) -> bool:
+    def update_affection(self, session_id: str, delta: int) -> Optional[int]:
         """
         Update affection level for a session
         
@@ -91,23 +195,28 @@ class SessionManager:
             delta: Amount to change affection level by
             
         Returns:
-            bool: True if update was successful, False otherwise
+            int: New affection level if update was successful, None otherwise
         """
         session = self.get_session(session_id)
         if not session:
-            logging.warning(f"Attempted to update affection for non-existent session: {session_id}")
-            return False
-        
-        # Apply delta with bounds checking (0-100)
-        old_affection = session.affection_level
-        session.affection_level = max(0, min(100, session.affection_level + delta))
-        session.last_interaction = datetime.now().isoformat()
-        
-        # Save updated session
-        self.save_session(session_id)
-        
-        logging.info(f"Session {session_id}: Affection updated from {old_affection} to {session.affection_level} (delta: {delta})")
-        return True
+            logger.warning("Attempted to update affection for non-existent session: %s", session_id)
+            return None
+        
+        with _stripe_of(session_id):
+            # Apply delta with bounds checking (0-100)
+            old_affection = session.affection_level
+            session.affection_level = max(0, min(100, session.affection_level + delta))
+            session.touch()
+            
+            # Persist only the changed fields
+            self._persist_delta(session, {
+                "affection_level": session.affection_level,
+                "last_interaction": session.last_interaction
+            })
+        
+        logger.info("Session %s: Affection updated from %d to %d (delta: %d)",
+                    session_id, old_affection, session.affection_level, delta)
+        return session.affection_level
     
     def get_affection_level(self, session_id: str) -> int:
         """
@@ -124,27 +233,130 @@ class SessionManager:
     
     def save_session(self, session_id: str) -> bool:
         """
-        Save session data to persistent storage
+        Queue a session snapshot for the background writer
+        
+        Several saves of the same session within SAVE_DEBOUNCE_INTERVAL are
+        coalesced into a single disk write. Use flush() to write immediately.
         
         Args:
             session_id: ID of the session to save
             
         Returns:
-            bool: True if save was successful, False otherwise
+            bool: True if the session was queued, False if it does not exist
         """
-        session = self.current_sessions.get(session_id)
+        with self._cache_lock:
+            session = self.current_sessions.get(session_id)
         if not session:
-            logging.error(f"Attempted to save non-existent session: {session_id}")
+            logger.error("Attempted to save non-existent session: %s", session_id)
             return False
         
-        success = self.storage.save_session(session)
+        return self._save_session_obj(session)
+    
+    def _save_session_obj(self, session: UserSession) -> bool:
+        """
+        Queue a snapshot of a session object the caller already holds
+        
+        Args:
+            session: Cached session to save
+            
+        Returns:
+            bool: Always True (the session was queued)
+        """
+        with self._dirty_cv:
+            self._dirty[session.user_id] = session
+            self._dirty_cv.notify()
+        return True
+    
+    def flush(self) -> None:
+        """Write all queued session snapshots now"""
+        with self._dirty_cv:
+            dirty, self._dirty = self._dirty, {}
+            evicted_ids = list(self._evicted)
+        if not dirty and not evicted_ids:
+            return
+        
+        for session in dirty.values():
+            self._write_session(session)
+        for session_id in evicted_ids:
+            self._write_evicted(session_id)
+        # Write the session index once for the whole batch
+        self.storage.flush_index()
+        # One directory fsync makes every rename in this batch durable
+        self.storage.sync_directory()
+    
+    def _writer_loop(self) -> None:
+        """Background writer: drain queued saves every SAVE_DEBOUNCE_INTERVAL"""
+        while True:
+            with self._dirty_cv:
+                while not self._dirty and not self._evicted:
+                    self._dirty_cv.wait()
+            # Let further saves of the same sessions accumulate before draining
+            time.sleep(SAVE_DEBOUNCE_INTERVAL)
+            self.flush()
+    
+    def _write_session(self, session: UserSession) -> bool:
+        """
+        Write a queued session snapshot to persistent storage
+        
+        Args:
+            session: Session object that was queued
+            
+        Returns:
+            bool: True if save was successful, False otherwise
+        """
+        session_id = session.user_id
+        with self._cache_lock:
+            cached = self.current_sessions.get(session_id)
+        if cached is not session:
+            # Evicted in the meantime (eviction queues its own snapshot); a
+            # reloaded copy may have newer deltas that this one must not drop
+            return True
+        
+        # Serialize with any delta append for this session so none is dropped with the log
+        with _stripe_of(session_id):
+            success = self.storage.save_session(session)
         if success:
-            logging.debug(f"Session {session_id} saved successfully")
+            logger.debug("Session %s saved successfully", session_id)
         else:
-            logging.error(f"Failed to save session {session_id}")
+            logger.error("Failed to save session %s", session_id)
         
         return success
     
+    def _write_evicted(self, session_id: str) -> None:
+        """
+        Write the snapshot of a session queued by _save_evicted
+        
+        The queued copy is taken under the stripe lock, so get_session either
+        re-adopts it before this runs or loads the snapshot written here.
+        
+        Args:
+            session_id: ID of the evicted session
+        """
+        with _stripe_of(session_id):
+            with self._dirty_cv:
+                session = self._evicted.pop(session_id, None)
+            if session is not None and not self.storage.save_session(session):
+                logger.error("Failed to save evicted session %s", session_id)
+    
+    def _persist_delta(self, session: UserSession, record: Dict[str, Any]) -> bool:
+        """
+        Persist a change as a delta record, compacting or falling back to a full save
+        
+        Args:
+            session: The changed session
+            record: Delta record (see SessionStorage.append_delta)
+            
+        Returns:
+            bool: True if the change was persisted, False otherwise
+        """
+        if not self.storage.append_delta(session.user_id, record):
+            return self._save_session_obj(session)
+        
+        if self.storage.needs_compaction(session.user_id):
+            return self._save_session_obj(session)
+        
+        return True
+    
     def update_conversation_history(self, session_id: str, user_input: str, assistant_response: str) -> bool:
         """
         Update conversation history for a session
@@ -159,22 +371,31 @@ class SessionManager:
         """
         session = self.get_session(session_id)
         if not session:
-            logging.warning(f"Attempted to update conversation history for non-existent session: {session_id}")
+            logger.warning("Attempted to update conversation history for non-existent session: %s", session_id)
             return False
         
-        session.conversation_history.append({
-            "timestamp": datetime.now().isoformat(),
-            "user": user_input,
-            "assistant": assistant_response
-        })
-        
-        # 会話履歴が長くなりすぎた場合、古い履歴を要約または破棄
-        MAX_HISTORY_LENGTH = 7  # 保持する最大の会話ターン数（5〜10の間で設定）
-        if len(session.conversation_history) > MAX_HISTORY_LENGTH:
-            self._summarize_conversation_history(session)
-        
-        session.last_interaction = datetime.now().isoformat()
-        return self.save_session(session_id)
+        with _stripe_of(session_id):
+            now = datetime.now()
+            turn = {
+                "timestamp": now.isoformat(),
+                "user": user_input,
+                "assistant": assistant_response
+            }
+            session.conversation_history.append(turn)
+            
+            # 会話履歴が長くなりすぎた場合、古い履歴を要約または破棄
+            MAX_HISTORY_LENGTH = 7  # 保持する最大の会話ターン数（5〜10の間で設定）
+            if len(session.conversation_history) > MAX_HISTORY_LENGTH:
+                self._summarize_conversation_history(session)
+            
+            session.touch(now)
+            
+            # Persist only the new turn; "keep" lets replay reproduce any trimming
+            return self._persist_delta(session, {
+                "turn": turn,
+                "keep": len(session.conversation_history),
+                "last_interaction": session.last_interaction
+            })
         
     def _summarize_conversation_history(self, session: UserSession) -> None:
         """
@@ -190,10 +411,13 @@ class SessionManager:
         # 注: 実際の要約機能を実装する場合は、ここでLLMを使って要約を生成することも可能
         recent_history = session.conversation_history[-5:]
         
+        # 破棄する古い履歴はアーカイブファイルに退避する
+        self.storage.archive_history(session.user_id, session.conversation_history[:-5])
+        
         # 古い履歴を破棄し、最新の履歴のみを保持
         session.conversation_history = recent_history
         
-        logging.info(f"Session {session.user_id}: Conversation history summarized, keeping last 5 turns")
+        logger.info("Session %s: Conversation history summarized, keeping last 5 turns", session.user_id)
     
     def cleanup_old_sessions(self, days_old: int = 30) -> int:
         """
@@ -214,9 +438,10 @@ class SessionManager:
             current_session_ids = set(self.storage.list_sessions())
             
             # Remove any sessions from memory that no longer exist in storage
-            for session_id in list(self.current_sessions.keys()):
-                if session_id not in current_session_ids:
-                    del self.current_sessions[session_id]
+            with self._cache_lock:
+                for session_id in list(self.current_sessions.keys()):
+                    if session_id not in current_session_ids:
+                        del self.current_sessions[session_id]
         
         return cleaned_count
     
@@ -229,6 +454,35 @@ class SessionManager:
         """
         return self.storage.list_sessions()
     
+    def list_sessions_with_last_interaction(self, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        """
+        List session IDs with their last interaction timestamp in one pass
+        
+        Sessions held in memory take precedence over their stored copy, since
+        they may not have been saved yet.
+        
+        Args:
+            limit: Maximum number of entries to return (most recent first)
+            
+        Returns:
+            List of (session_id, iso_timestamp) tuples
+        """
+        # get_session reorders the cache, so iterate over a snapshot taken under the lock
+        with self._cache_lock:
+            cached_sessions = list(self.current_sessions.items())
+        
+        entries = dict(self.storage.list_sessions_with_last_interaction())
+        entries.update({
+            session_id: session.last_interaction
+            for session_id, session in cached_sessions
+            if session.last_interaction
+        })
+        
+        results = list(entries.items())
+        if limit is not None:
+            results = heapq.nlargest(limit, results, key=itemgetter(1))
+        return results
+    
     def get_session_stats(self) -> Dict[str, Any]:
         """
         Get statistics about stored sessions
@@ -238,14 +492,148 @@ class SessionManager:
         """
         return self.storage.get_session_stats()
 
+# Upper bound (inclusive) of each relationship stage's affection range; levels
+# above the last threshold are "close"
+_STAGE_THRESHOLDS = (
+    10,  # hostile: 閾値を下げて、より厳しい警戒心を表現
+    25,  # distant: 距離を置く段階も厳しく
+    45,  # cautious
+    65,  # friendly
+    85,  # warm
+)
+_STAGES = ("hostile", "distant", "cautious", "friendly", "warm", "close")
+
+# Stage for every valid affection level (0-100), so the common case is one index
+_STAGE_FOR_LEVEL = tuple(_STAGES[bisect.bisect_left(_STAGE_THRESHOLDS, level)] for level in range(101))
+
+# Relationship stage descriptions
+_DESCRIPTIONS = {
+    "hostile": "極端に警戒し、敵対的・攻撃的な態度。信頼関係がほぼ皆無で、強い拒絶反応を示す。",
+    "distant": "警戒心が強く、冷たい態度。基本的に心を閉ざしているが、わずかな対話の余地がある。",
+    "cautious": "少しずつ警戒が解け始め、時折本音が漏れる。まだ距離は保っているが、徐々に心を開き始めている。",
+    "friendly": "警戒心が薄れ、素直な対話が増える。ぶっきらぼうながらも、会話を楽しむ様子が見られる。",
+    "warm": "信頼関係が築かれ、本音で話すことが増える。時折弱さや不安を見せるようになる。",
+    "close": "深い信頼関係が形成され、素直な感情表現が増える。寂しさや依存心を隠さなくなる。"
+}
+
+# Base personality traits that remain consistent across all stages
+_BASE_TRAITS = {
+    "core_personality": "警戒心が強い、不器用、ぶっきらぼうな男っぽい話し方",
+    "speech_patterns": ["〜だろ", "〜じゃねーか", "うっせー", "バカかよ"],
+    "first_person": "あたし"
+}
+
+# Stage-specific behavioral traits
+_STAGE_TRAITS = {
+    "hostile": {
+        "openness": "極めて低い",
+        "trust": "皆無",
+        "vulnerability": "見せない",
+        "communication_style": "攻撃的、拒絶的",
+        "emotional_expression": "怒り、敵意",
+        "characteristic_phrases": ["近づくな", "うざい", "消えろ"],
+        "relationship_dynamics": "完全な拒絶と敵対"
+    },
+    "distant": {
+        "openness": "低い",
+        "trust": "ほぼない",
+        "vulnerability": "見せない",
+        "communication_style": "冷たい、無愛想",
+        "emotional_expression": "冷淡、無関心",
+        "characteristic_phrases": ["知らねーよ", "関係ねーし", "ふん"],
+        "relationship_dynamics": "冷たい距離感と最低限の対話"
+    },
+    "cautious": {
+        "openness": "限定的",
+        "trust": "わずか",
+        "vulnerability": "ほとんど見せない",
+        "communication_style": "警戒的、時々素直",
+        "emotional_expression": "控えめ、時折興味",
+        "characteristic_phrases": ["まぁいいけど", "別にいいよ", "そう…"],
+        "relationship_dynamics": "徐々に溶ける警戒心と限定的な対話"
+    },
+    "friendly": {
+        "openness": "中程度",
+        "trust": "形成中",
+        "vulnerability": "時々見せる",
+        "communication_style": "ぶっきらぼうだが友好的",
+        "emotional_expression": "興味、時に喜び",
+        "characteristic_phrases": ["悪くないな", "まぁいいか", "ちょっと嬉しい"],
+        "relationship_dynamics": "表面上はツンツンしつつも内心では会話を楽しむ"
+    },
+    "warm": {
+        "openness": "高い",
+        "trust": "確立",
+        "vulnerability": "しばしば見せる",
+        "communication_style": "素直、時々照れ隠し",
+        "emotional_expression": "喜び、安心、時に不安",
+        "characteristic_phrases": ["ありがと…", "嬉しい", "寂しくなかったし"],
+        "relationship_dynamics": "信頼関係の中での素直な感情表現"
+    },
+    "close": {
+        "openness": "非常に高い",
+        "trust": "深い",
+        "vulnerability": "隠さない",
+        "communication_style": "素直、甘え",
+        "emotional_expression": "愛着、依存、不安",
+        "characteristic_phrases": ["側にいて", "寂しかった", "あたしのこと…好き？"],
+        "relationship_dynamics": "深い絆と素直な感情表現"
+    }
+}
+
+def _freeze(value: Any) -> Any:
+    """Recursively turn dicts into read-only mappings and lists into tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def copy_behavioral_state(state: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Make a mutable deep copy of a behavioral state
+    
+    Args:
+        state: Read-only state from AffectionTracker.get_mari_behavioral_state
+        
+    Returns:
+        The same data as plain dicts and lists (safe to mutate or store in UI state)
+    """
+    def thaw(value: Any) -> Any:
+        if isinstance(value, Mapping):
+            return {key: thaw(item) for key, item in value.items()}
+        if isinstance(value, tuple):
+            return [thaw(item) for item in value]
+        return value
+    
+    return thaw(state)
+
+# Behavioral state for each stage, built once. The mappings are read-only all
+# the way down; use copy_behavioral_state() before mutating or storing in UI state.
+_MARI_STATE_BY_STAGE: Dict[str, Mapping[str, Any]] = {
+    stage: _freeze({
+        **_BASE_TRAITS,
+        "stage": stage,
+        "stage_traits": _STAGE_TRAITS[stage],
+        "description": _DESCRIPTIONS[stage]
+    })
+    for stage in _STAGES
+}
+
 class AffectionTracker:
     """Handles affection parameter calculations and tracking"""
     
     def __init__(self, session_manager: SessionManager):
         self.session_manager = session_manager
         self.sentiment_analyzer = SentimentAnalyzer()
-        self.sentiment_history = {}  # Store sentiment analysis history by session
-        self.pending_affection_changes = {}  # Store pending gradual affection changes
+        # Per-instance cache keyed by the analyzer's own normalization (lower + strip)
+        self._cached_analysis = lru_cache(maxsize=SENTIMENT_CACHE_SIZE)(self.sentiment_analyzer.analyze_user_input)
+        # Recent sentiment analysis history by session, bounded per session
+        self.sentiment_history = defaultdict(partial(deque, maxlen=SENTIMENT_HISTORY_SIZE))
+        # Pending gradual affection changes by session, each a min-heap of
+        # (scheduled_ns, delta) with epoch-nanosecond times
+        self._pending_heaps: Dict[str, List[Tuple[int, int]]] = {}
+        self._pending_lock = threading.Lock()
     
     def get_relationship_stage(self, affection_level: int) -> str:
         """
@@ -257,126 +645,44 @@ class AffectionTracker:
         Returns:
             String representing the relationship stage
         """
-        if affection_level <= 10:  # 閾値を下げて、より厳しい警戒心を表現
-            return "hostile"
-        elif affection_level <= 25:  # 距離を置く段階も厳しく
-            return "distant"
-        elif affection_level <= 45:
-            return "cautious"
-        elif affection_level <= 65:
-            return "friendly"
-        elif affection_level <= 85:
-            return "warm"
-        else:
-            return "close"
+        if 0 <= affection_level <= 100:
+            try:
+                return _STAGE_FOR_LEVEL[affection_level]
+            except TypeError:
+                pass  # non-integer level; fall back to the thresholds
+        return _STAGES[bisect.bisect_left(_STAGE_THRESHOLDS, affection_level)]
             
-    def get_relationship_description(self, affection_level: int) -> str:
+    def get_relationship_description(self, affection_level: int, stage: Optional[str] = None) -> str:
         """
         Get a detailed description of the current relationship stage
         
         Args:
             affection_level: Current affection level (0-100)
+            stage: Relationship stage if already known (skips recomputation)
             
         Returns:
             String describing the relationship dynamics at this stage
         """
-        stage = self.get_relationship_stage(affection_level)
-        
-        descriptions = {
-            "hostile": "極端に警戒し、敵対的・攻撃的な態度。信頼関係がほぼ皆無で、強い拒絶反応を示す。",
-            "distant": "警戒心が強く、冷たい態度。基本的に心を閉ざしているが、わずかな対話の余地がある。",
-            "cautious": "少しずつ警戒が解け始め、時折本音が漏れる。まだ距離は保っているが、徐々に心を開き始めている。",
-            "friendly": "警戒心が薄れ、素直な対話が増える。ぶっきらぼうながらも、会話を楽しむ様子が見られる。",
-            "warm": "信頼関係が築かれ、本音で話すことが増える。時折弱さや不安を見せるようになる。",
-            "close": "深い信頼関係が形成され、素直な感情表現が増える。寂しさや依存心を隠さなくなる。"
-        }
+        if stage is None:
+            stage = self.get_relationship_stage(affection_level)
         
-        return descriptions.get(stage, "関係性が不明確")
+        return _DESCRIPTIONS.get(stage, "関係性が不明確")
     
-    def get_mari_behavioral_state(self, affection_level: int) -> dict:
+    def get_mari_behavioral_state(self, affection_level: int, stage: Optional[str] = None) -> Mapping[str, Any]:
         """
         Map affection level to Mari's behavioral characteristics
         
         Args:
             affection_level: Current affection level (0-100)
+            stage: Relationship stage if already known (skips recomputation)
             
         Returns:
-            Dictionary containing behavioral traits and communication style
-        """
-        stage = self.get_relationship_stage(affection_level)
-        
-        # Base personality traits that remain consistent across all stages
-        base_traits = {
-            "core_personality": "警戒心が強い、不器用、ぶっきらぼうな男っぽい話し方",
-            "speech_patterns": ["〜だろ", "〜じゃねーか", "うっせー", "バカかよ"],
-            "first_person": "あたし"
-        }
-        
-        # Stage-specific behavioral traits
-        stage_traits = {
-            "hostile": {
-                "openness": "極めて低い",
-                "trust": "皆無",
-                "vulnerability": "見せない",
-                "communication_style": "攻撃的、拒絶的",
-                "emotional_expression": "怒り、敵意",
-                "characteristic_phrases": ["近づくな", "うざい", "消えろ"],
-                "relationship_dynamics": "完全な拒絶と敵対"
-            },
-            "distant": {
-                "openness": "低い",
-                "trust": "ほぼない",
-                "vulnerability": "見せない",
-                "communication_style": "冷たい、無愛想",
-                "emotional_expression": "冷淡、無関心",
-                "characteristic_phrases": ["知らねーよ", "関係ねーし", "ふん"],
-                "relationship_dynamics": "冷たい距離感と最低限の対話"
-            },
-            "cautious": {
-                "openness": "限定的",
-                "trust": "わずか",
-                "vulnerability": "ほとんど見せない",
-                "communication_style": "警戒的、時々素直",
-                "emotional_expression": "控えめ、時折興味",
-                "characteristic_phrases": ["まぁいいけど", "別にいいよ", "そう…"],
-                "relationship_dynamics": "徐々に溶ける警戒心と限定的な対話"
-            },
-            "friendly": {
-                "openness": "中程度",
-                "trust": "形成中",
-                "vulnerability": "時々見せる",
-                "communication_style": "ぶっきらぼうだが友好的",
-                "emotional_expression": "興味、時に喜び",
-                "characteristic_phrases": ["悪くないな", "まぁいいか", "ちょっと嬉しい"],
-                "relationship_dynamics": "表面上はツンツンしつつも内心では会話を楽しむ"
-            },
-            "warm": {
-                "openness": "高い",
-                "trust": "確立",
-                "vulnerability": "しばしば見せる",
-                "communication_style": "素直、時々照れ隠し",
-                "emotional_expression": "喜び、安心、時に不安",
-                "characteristic_phrases": ["ありがと…", "嬉しい", "寂しくなかったし"],
-                "relationship_dynamics": "信頼関係の中での素直な感情表現"
-            },
-            "close": {
-                "openness": "非常に高い",
-                "trust": "深い",
-                "vulnerability": "隠さない",
-                "communication_style": "素直、甘え",
-                "emotional_expression": "愛着、依存、不安",
-                "characteristic_phrases": ["側にいて", "寂しかった", "あたしのこと…好き？"],
-                "relationship_dynamics": "深い絆と素直な感情表現"
-            }
-        }
-        
-        # Combine base traits with stage-specific traits
-        result = base_traits.copy()
-        result.update({"stage": stage})
-        result.update({"stage_traits": stage_traits[stage]})
-        result.update({"description": self.get_relationship_description(affection_level)})
+            Read-only mapping containing behavioral traits and communication style
+        """
+        if stage is None:
+            stage = self.get_relationship_stage(affection_level)
         
-        return result
+        return _MARI_STATE_BY_STAGE[stage]
     
     def analyze_user_sentiment(self, user_input: str) -> SentimentAnalysisResult:
         """
@@ -388,7 +694,12 @@ class AffectionTracker:
         Returns:
             SentimentAnalysisResult with sentiment analysis details
         """
-        return self.sentiment_analyzer.analyze_user_input(user_input)
+        normalized_input = user_input.lower().strip() if user_input else ""
+        if len(normalized_input) > SENTIMENT_CACHE_MAX_INPUT:
+            return self.sentiment_analyzer.analyze_user_input(user_input)
+        
+        # The analyzer only looks at the normalized text, so cached results are exact
+        return self._cached_analysis(normalized_input)
     
     def calculate_affection_delta(self, user_input: str) -> Tuple[int, SentimentAnalysisResult]:
         """
@@ -419,57 +730,63 @@ class AffectionTracker:
         """
         delta, sentiment_result = self.calculate_affection_delta(user_input)
         
-        # Store sentiment analysis in history
-        if session_id not in self.sentiment_history:
-            self.sentiment_history[session_id] = []
-        
-        # 感情の自然回復機能
-        # 前回の感情タイプを取得
-        previous_interaction_type = None
-        if self.sentiment_history[session_id]:
-            previous_interaction_type = self.sentiment_history[session_id][-1].get("interaction_type")
-        
-        # 前回がhostileまたはnegativeで、今回がneutralまたはpositiveの場合、
-        # 自然回復ボーナスを追加（キレのループから抜け出しやすくする）
-        recovery_bonus = 0
-        if previous_interaction_type in ["hostile", "negative"] and sentiment_result.interaction_type in ["neutral", "positive", "caring", "appreciative"]:
-            recovery_bonus = 2  # 回復ボーナス
-            logging.info(f"Applied recovery bonus of +{recovery_bonus} for session {session_id} (transitioning from {previous_interaction_type} to {sentiment_result.interaction_type})")
-        
-        # 連続したネガティブ反応に対するペナルティ軽減
-        # 前回と今回の両方がhostileまたはnegativeの場合、ペナルティを軽減
-        if previous_interaction_type in ["hostile", "negative"] and sentiment_result.interaction_type in ["hostile", "negative"]:
-            if delta < 0:
-                # ネガティブな変化を半分に軽減
-                delta = delta // 2
-                logging.info(f"Reduced negative affection impact from {delta*2} to {delta} for session {session_id} (consecutive negative interactions)")
-        
-        # 感情履歴を更新
-        self.sentiment_history[session_id].append({
-            "timestamp": datetime.now().isoformat(),
-            "user_input": user_input,
-            "sentiment_score": sentiment_result.sentiment_score,
-            "interaction_type": sentiment_result.interaction_type,
-            "affection_delta": delta + recovery_bonus,  # 回復ボーナスを含む
-            "detected_keywords": sentiment_result.detected_keywords
-        })
-        
-        # 回復ボーナスを適用
-        adjusted_delta = delta + recovery_bonus
-        
-        # Only update affection if there's a non-zero delta
-        if adjusted_delta != 0:
-            # For large changes, apply smoothing
-            if abs(adjusted_delta) > 5:
-                self._schedule_gradual_affection_change(session_id, adjusted_delta)
-            else:
-                # Small changes apply immediately
-                self.session_manager.update_affection(session_id, adjusted_delta)
+        # Make sure the session is cached before taking its stripe lock; the
+        # same object is updated in place, so it also yields the new level
+        session = self.session_manager.get_session(session_id)
+        
+        # Sentiment history and affection updates for one session are applied atomically
+        with _stripe_of(session_id):
+            # 感情の自然回復機能
+            # 前回の感情タイプを取得
+            previous_interaction_type = None
+            if self.sentiment_history[session_id]:
+                previous_interaction_type = self.sentiment_history[session_id][-1].get("interaction_type")
+            
+            # 前回がhostileまたはnegativeで、今回がneutralまたはpositiveの場合、
+            # 自然回復ボーナスを追加（キレのループから抜け出しやすくする）
+            recovery_bonus = 0
+            if previous_interaction_type in ["hostile", "negative"] and sentiment_result.interaction_type in ["neutral", "positive", "caring", "appreciative"]:
+                recovery_bonus = 2  # 回復ボーナス
+                logger.info("Applied recovery bonus of +%d for session %s (transitioning from %s to %s)",
+                            recovery_bonus, session_id, previous_interaction_type, sentiment_result.interaction_type)
+            
+            # 連続したネガティブ反応に対するペナルティ軽減
+            # 前回と今回の両方がhostileまたはnegativeの場合、ペナルティを軽減
+            if previous_interaction_type in ["hostile", "negative"] and sentiment_result.interaction_type in ["hostile", "negative"]:
+                if delta < 0:
+                    # ネガティブな変化を半分に軽減
+                    delta = delta // 2
+                    logger.info("Reduced negative affection impact from %d to %d for session %s (consecutive negative interactions)",
+                                delta * 2, delta, session_id)
+            
+            # 感情履歴を更新
+            self.sentiment_history[session_id].append({
+                "timestamp_ns": time.time_ns(),  # formatted in get_sentiment_history
+                "user_input": user_input,
+                "sentiment_score": sentiment_result.sentiment_score,
+                "interaction_type": sentiment_result.interaction_type,
+                "affection_delta": delta + recovery_bonus,  # 回復ボーナスを含む
+                "detected_keywords": sentiment_result.detected_keywords
+            })
+            
+            # 回復ボーナスを適用
+            adjusted_delta = delta + recovery_bonus
+            
+            # Only update affection if there's a non-zero delta
+            if adjusted_delta != 0:
+                # For large changes, apply smoothing
+                if abs(adjusted_delta) > 5:
+                    self._schedule_gradual_affection_change(session_id, adjusted_delta)
+                else:
+                    # Small changes apply immediately
+                    self.session_manager.update_affection(session_id, adjusted_delta)
+            
         
-        # Process any pending gradual changes
+        # Process any pending gradual changes (outside the stripe lock, since due
+        # changes of other sessions take their own stripes)
         self._process_pending_affection_changes(session_id)
         
-        new_level = self.session_manager.get_affection_level(session_id)
+        new_level = session.affection_level if session else 15  # Default low affection
         return new_level, sentiment_result
         
     def _schedule_gradual_affection_change(self, session_id: str, total_delta: int) -> None:
@@ -480,10 +797,6 @@ class AffectionTracker:
             session_id: The user's session ID
             total_delta: The total affection change to apply gradually
         """
-        # Initialize pending changes for this session if not exists
-        if session_id not in self.pending_affection_changes:
-            self.pending_affection_changes[session_id] = []
-        
         # For large positive changes, apply 1/3 immediately and schedule the rest
         immediate_change = total_delta // 3
         remaining_change = total_delta - immediate_change
@@ -491,60 +804,56 @@ class AffectionTracker:
         # Apply immediate portion
         if immediate_change != 0:
             self.session_manager.update_affection(session_id, immediate_change)
-            logging.debug(f"Applied immediate affection change of {immediate_change} for session {session_id}")
+            logger.debug("Applied immediate affection change of %d for session %s", immediate_change, session_id)
         
         # Schedule remaining change in smaller increments
         if remaining_change != 0:
-            # Split remaining change into smaller increments
-            increments = []
-            increment_size = 2 if remaining_change > 0 else -2
-            
-            while abs(sum(increments)) < abs(remaining_change):
-                next_increment = min(increment_size, remaining_change - sum(increments)) if remaining_change > 0 else \
-                                max(increment_size, remaining_change - sum(increments))
-                increments.append(next_increment)
-            
-            # Add increments to pending changes with timestamps
-            current_time = datetime.now()
-            for i, increment in enumerate(increments):
-                # Schedule increments with increasing delays
-                scheduled_time = current_time + timedelta(minutes=i+1)
-                self.pending_affection_changes[session_id].append({
-                    "delta": increment,
-                    "scheduled_time": scheduled_time.isoformat()
-                })
-            
-            logging.debug(f"Scheduled {len(increments)} gradual affection changes for session {session_id}")
+            # Split remaining change into increments of 2 (plus a final 1 if odd)
+            sign = 1 if remaining_change > 0 else -1
+            n_full, tail = divmod(abs(remaining_change), 2)
+            increments = [2 * sign] * n_full
+            if tail:
+                increments.append(sign * tail)
+            
+            # Add increments to pending changes with timestamps (epoch nanoseconds)
+            current_ns = time.time_ns()
+            with self._pending_lock:
+                pending = self._pending_heaps.setdefault(session_id, [])
+                for i, increment in enumerate(increments):
+                    # Schedule increments with increasing delays
+                    scheduled_ns = current_ns + (i + 1) * _MINUTE_NS
+                    heapq.heappush(pending, (scheduled_ns, increment))
+            
+            logger.debug("Scheduled %d gradual affection changes for session %s", len(increments), session_id)
     
     def _process_pending_affection_changes(self, session_id: str) -> None:
         """
         Process any pending gradual affection changes that are due
         
+        Each session's changes are kept in a time-ordered heap, so only the due
+        entries are touched. Only this session's changes are applied, on its own
+        turn, so other sessions' last interaction times are left alone.
+        
         Args:
             session_id: The user's session ID
         """
-        if session_id not in self.pending_affection_changes:
-            return
-        
-        current_time = datetime.now()
-        changes_to_apply = []
-        remaining_changes = []
+        current_ns = time.time_ns()
+        due_changes = []
         
-        # Check which changes are due
-        for change in self.pending_affection_changes[session_id]:
-            scheduled_time = datetime.fromisoformat(change["scheduled_time"])
-            if current_time >= scheduled_time:
-                changes_to_apply.append(change)
-            else:
-                remaining_changes.append(change)
+        # Pop every change of this session that is due
+        with self._pending_lock:
+            pending = self._pending_heaps.get(session_id)
+            if not pending:
+                return
+            while pending and pending[0][0] <= current_ns:
+                due_changes.append(heapq.heappop(pending)[1])
+            if not pending:
+                del self._pending_heaps[session_id]
         
         # Apply due changes
-        for change in changes_to_apply:
-            self.session_manager.update_affection(session_id, change["delta"])
-            logging.debug(f"Applied scheduled affection change of {change['delta']} for session {session_id}")
-        
-        # Update pending changes
-        self.pending_affection_changes[session_id] = remaining_changes
+        for delta in due_changes:
+            self.session_manager.update_affection(session_id, delta)
+            logger.debug("Applied scheduled affection change of %d for session %s", delta, session_id)
     
     def get_sentiment_history(self, session_id: str, limit: int = 10) -> list:
         """
@@ -557,10 +866,15 @@ class AffectionTracker:
         Returns:
             List of sentiment analysis history items
         """
-        if session_id not in self.sentiment_history:
+        history = self.sentiment_history.get(session_id)
+        if not history:
             return []
         
-        return self.sentiment_history[session_id][-limit:]
+        # Timestamps are stored as epoch nanoseconds and formatted only here
+        return [
+            {"timestamp": datetime.fromtimestamp(item["timestamp_ns"] / 1e9).isoformat(), **item}
+            for item in islice(history, max(0, len(history) - limit), None)
+        ]
 
 # Global instances (will be initialized in main app)
 session_manager: Optional[SessionManager] = None
@@ -585,20 +899,23 @@ def initialize_affection_system(storage_dir: str = "sessions", auto_load_session
     # Auto-load active sessions if enabled
     if auto_load_sessions:
         loaded_count = _load_active_sessions()
-        logging.info(f"Auto-loaded {loaded_count} active sessions")
+        logger.info("Indexed %d active sessions (loaded on first access)", loaded_count)
     
-    logging.info("Affection system initialized successfully")
+    logger.info("Affection system initialized successfully")
     return session_manager, affection_tracker
 
 def _load_active_sessions(max_age_days: int = 30) -> int:
     """
-    Load active sessions into memory cache
+    Index active sessions at startup
+    
+    Only the session index is read; each session is decoded lazily by
+    SessionManager.get_session on first access.
     
     Args:
         max_age_days: Maximum age in days for sessions to be considered active
         
     Returns:
-        Number of sessions loaded
+        Number of active sessions found
     """
     if not session_manager:
         return 0
@@ -607,30 +924,21 @@ def _load_active_sessions(max_age_days: int = 30) -> int:
     current_time = datetime.now()
     
     try:
-        # Get all session IDs
-        session_ids = session_manager.list_sessions()
-        
-        for session_id in session_ids:
-            # Load session
-            session = session_manager.get_session(session_id)
-            if not session:
-                continue
-            
+        for session_id, last_interaction_str in session_manager.storage.list_sessions_with_last_interaction():
             try:
                 # Check if session is active (used within max_age_days)
-                last_interaction = datetime.fromisoformat(session.last_interaction)
+                last_interaction = datetime.fromisoformat(last_interaction_str)
                 days_since_interaction = (current_time - last_interaction).days
                 
                 if days_since_interaction <= max_age_days:
-                    # Session is active, keep it in memory
                     loaded_count += 1
-                    logging.debug(f"Loaded active session: {session_id} "
-                                 f"(last used {days_since_interaction} days ago)")
+                    logger.debug("Indexed active session: %s (last used %d days ago)",
+                                 session_id, days_since_interaction)
             except (ValueError, TypeError) as e:
-                logging.error(f"Error parsing date for session {session_id}: {str(e)}")
+                logger.error("Error parsing date for session %s: %s", session_id, e)
     
     except Exception as e:
-        logging.error(f"Error loading active sessions: {str(e)}")
+        logger.error("Error loading active sessions: %s", e)
     
     return loaded_count
 
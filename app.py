@@ -1,22 +1,124 @@
 import os
 import re
-import requests
+import asyncio
+import time
+import queue
+import atexit
+import gzip
+import shutil
 import gradio as gr
 import logging
-import json
-import uuid
+import logging.handlers
+import orjson
+from itertools import product
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from datetime import datetime
 from fastapi import FastAPI
-from typing import List, Tuple, Any, Optional, Dict
-from fastapi.responses import JSONResponse
+from typing import List, Tuple, Any, Optional, AsyncIterator
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 from tsundere_aware_prompt_generator import TsundereAwarePromptGenerator
-from affection_system import initialize_affection_system, get_session_manager, get_affection_tracker
+from affection_system import initialize_affection_system, get_session_manager, get_affection_tracker, copy_behavioral_state
 from usage_statistics import initialize_usage_statistics, get_usage_statistics
 from user_info_extractor import extract_and_update_user_info
 
 
+# --- clean_meta 用のパターン（モジュール読み込み時に一度だけ構築） ---
+# 括弧内の注釈（日本語・英語）
+_PAREN_NOTE_RE = re.compile(r'（[^（）]*）|\([^()]*\)')
+# 角括弧内の注釈
+_SQUARE_NOTE_RE = re.compile(r'\[[^\[\]]*\]')
+
+# 例示の修飾語と対象（「良い応答」「これは悪い例です」など）
+_EXAMPLE_QUALIFIERS = ('良い', '悪い', '適切', '不適切', '正しい', '誤った', '推奨', '非推奨')
+_EXAMPLE_NOUNS = ('応答', '会話', '対応', '反応', '例', '例文', 'サンプル')
+
+# 特定のプレフィックスで始まる行は削除（すべて固定文字列なので str.startswith で判定）
+_META_PREFIXES = (
+    # 英語のメタ情報
+    'Note:', 'Response:', 'Example:', 'Explanation:', 'Context:', 'Clarification:', 'Instruction:', 'Guidance:',
+    # 日本語のメタ情報
+    '補足:', '説明:', '注意:', '注:', 'メモ:', '例:', '例示:', 'ヒント:', 'アドバイス:', 'ポイント:', '解説:',
+    '前提:', '状況:', '設定:', '背景:', '理由:', '注釈:', '参考:', '例文:', '回答例:', '応答例:',
+    # 記号で始まるメタ情報（「#」はマークダウン形式の見出しや「# 良い応答例」なども含む）
+    '※', '#', '・',
+    # 会話形式のプレフィックス
+    '麻理:', 'ユーザー:', 'システム:', 'AI:', 'Mari:', 'User:', 'System:',
+    # 良い例・悪い例などの例示
+    *(q + n for q, n in product(_EXAMPLE_QUALIFIERS, _EXAMPLE_NOUNS)),
+    # システムプロンプトの内容
+    '基本人格', '外見・設定', '話し方の特徴', '重要な行動原則', '絶対にしないこと', '自然な反応を心がけること',
+    '性的話題について', '最重要:', '以下の指示は絶対に守ってください', '以下の設定に基づいて',
+    'あなたは「麻理（まり）」という人格を持った',
+)
+
+# 含まれていれば行ごと削除する制約文・説明文（固定文字列の部分一致で判定）
+_META_LINE_PHRASES = (
+    # 例示・参考に関する表現
+    *(f'以上の{n}を参考に' for n in _EXAMPLE_NOUNS),
+    *(f'これは{q}{n}です' for q in ('',) + _EXAMPLE_QUALIFIERS for n in ('例', '例文', 'サンプル')),
+    '以上から', '以上により', '以上の通り', '以上のように',
+    'このように',
+    
+    # 制約・指示に関する表現
+    '一貫した受け答えを行', '制約事項に反する', 'ご留意ください', 'この設定に基づいて', '常に麻理として',
+    'キャラクターとして振る舞', 'キャラクター設定や状況を考えて', '会話は非常にデリケートです',
+    '相手の感情や状態に配慮', '親密度が上がるほど', 'ユーザーとの信頼関係を築く', '言葉選びを心がけて',
+    
+    # 説明・解説に関する表現
+    '説明すると', '補足すると', '注意点として', 'ポイントは', '重要なのは', 'ここでのポイントは',
+    
+    # メタ的な言及
+    'キャラクターの設定上', 'この性格では', 'このキャラクターは', '麻理の性格上', '麻理という人物は', '麻理の反応として',
+    
+    # 指示・命令に関する表現
+    '以下の指示に従って', '次のように応答してください', 'このように返答してください', '麻理として応答します',
+    '麻理の口調で返します', '麻理として一貫した', '麻理として直接会話', '麻理として振る舞', '麻理の立場から',
+    '麻理の視点で', '麻理の人格で', '麻理のキャラクターとして',
+)
+# 語順だけが決まっている表現（前の語の後ろに後の語が続く行を削除）
+_META_LINE_ORDERED_PHRASES = (('落ち着け', '逆効果'),)
+
+# 「〜です」「〜ます」などの敬語表現（麻理の口調と不一致）
+# 行内の最後の出現位置までを、この順番で削除する
+_POLITE_ENDINGS = (
+    'でしょうか。', 'します。', 'します', 'ください。', 'ください', 'お願いします。', 'お願いします',
+    'いたします。', 'いたします', '致します。', '致します',
+)
+
+# 敬語表現の削除後に残った部分に含まれていれば削除するシステムプロンプト関連の表現
+_META_PROMPT_PHRASES = (
+    'システムプロンプト', 'プロンプトに従って', 'プロンプトに基づいて', '設定に従って', '設定に基づいて',
+    '指示に従って', '指示に基づいて', 'キャラクター設定に基づいて', 'キャラクター設定に従って',
+)
+
+_SPACES_RE = re.compile(r'[ 　]+')
+
+# 応答として残す最大行数
+_MAX_RESPONSE_LINES = 5
+
+# クリーニング後に何も残らなかった場合の応答
+_EMPTY_RESPONSE_FALLBACK = "チッ、うっせーな..."
+
+# clean_meta が何かを変更する可能性のある箇所をまとめて検出する正規表現
+# （括弧・各種フレーズ・行頭/行末の空白・連続スペースなど）。一致しなければ応答はそのまま使える
+_CLEAN_META_TRIGGER_RE = re.compile(
+    r'[（(\[]|　|  |^\s|\s$|'
+    + '^(?:' + '|'.join(map(re.escape, _META_PREFIXES)) + ')|'
+    + '|'.join(map(re.escape, _META_LINE_PHRASES + _POLITE_ENDINGS + _META_PROMPT_PHRASES
+                   + tuple(first for first, _ in _META_LINE_ORDERED_PHRASES))),
+    re.MULTILINE
+)
+
+
+def _has_ordered_phrase(line: str) -> bool:
+    """_META_LINE_ORDERED_PHRASES のいずれかが語順どおりに含まれているか"""
+    for first, second in _META_LINE_ORDERED_PHRASES:
+        pos = line.find(first)
+        if pos != -1 and line.find(second, pos + len(first)) != -1:
+            return True
+    return False
 
 def clean_meta(text: str) -> str:
     """
@@ -32,167 +134,105 @@ def clean_meta(text: str) -> str:
     if not text or text.isspace():
         return ""
     
+    # 削除対象が何も含まれていない応答（大半の場合）は、行数制限だけを適用して返す
+    if not _CLEAN_META_TRIGGER_RE.search(text):
+        # 上限行数目の改行までだけを探し、それ以降の文字列は走査しない
+        newline_pos = -1
+        for _ in range(_MAX_RESPONSE_LINES):
+            newline_pos = text.find('\n', newline_pos + 1)
+            if newline_pos == -1:
+                return text
+        return text[:newline_pos]
+    
     # 括弧内の注釈を削除（日本語・英語、ネストされた括弧も対応）
-    cleaned_text = re.sub(r'（[^（）]*）|\([^()]*\)', '', text)
+    cleaned_text = _PAREN_NOTE_RE.sub('', text)
     # 2回適用して入れ子になった括弧にも対応
-    cleaned_text = re.sub(r'（[^（）]*）|\([^()]*\)', '', cleaned_text)
+    cleaned_text = _PAREN_NOTE_RE.sub('', cleaned_text)
     
     # 角括弧内の注釈を削除
-    cleaned_text = re.sub(r'\[[^\[\]]*\]', '', cleaned_text)
+    cleaned_text = _SQUARE_NOTE_RE.sub('', cleaned_text)
     
-    # 特定のプレフィックス行を削除（より包括的に）
-    prefix_patterns = [
-        # 英語のメタ情報
-        r'^(Note:|Response:|Example:|Explanation:|Context:|Clarification:|Instruction:|Guidance:).*',
-        # 日本語のメタ情報
-        r'^(補足:|説明:|注意:|注:|メモ:|例:|例示:|ヒント:|アドバイス:|ポイント:|解説:|前提:|状況:|設定:|背景:|理由:|注釈:|参考:|例文:|回答例:|応答例:).*',
-        # 記号で始まるメタ情報
-        r'^※.*',
-        r'^#.*',
-        r'^・.*',
-        # マークダウン形式の見出し
-        r'^#+\s+.*',
-        # 会話形式のプレフィックス
-        r'^(麻理:|ユーザー:|システム:|AI:|Mari:|User:|System:).*',
-        # 良い例・悪い例などの例示
-        r'^#\s*(良い|悪い|適切|不適切|正しい|誤った|推奨|非推奨)?(応答|会話|対応|反応|例|例文|サンプル).*',
-        r'^(良い|悪い|適切|不適切|正しい|誤った|推奨|非推奨)(応答|会話|対応|反応|例|例文|サンプル).*',
-        # システムプロンプトの内容
-        r'^基本人格.*',
-        r'^外見・設定.*',
-        r'^話し方の特徴.*',
-        r'^重要な行動原則.*',
-        r'^絶対にしないこと.*',
-        r'^自然な反応を心がけること.*',
-        r'^性的話題について.*',
-        r'^最重要:.*',
-        r'^以下の指示は絶対に守ってください.*',
-        r'^以下の設定に基づいて.*',
-        r'^あなたは「麻理（まり）」という人格を持った.*'
-    ]
-    
-    for pattern in prefix_patterns:
-        cleaned_text = re.sub(pattern, '', cleaned_text, flags=re.MULTILINE)
-    
-    # 制約文・説明文を削除（中間・文末の典型句、より包括的に）
-    removal_phrases = [
-        # 例示・参考に関する表現
-        r'.*以上の(応答|会話|対応|反応|例|例文|サンプル)を参考に.*',
-        r'.*これは(良い|悪い|適切|不適切|正しい|誤った|推奨|非推奨)?(例|例文|サンプル)です.*',
-        r'.*以上(から|により|の通り|のように).*',
-        r'.*このように.*',
+    # 1行ずつ処理し、残す行が上限（5行）に達したら残りは走査しない
+    kept_lines = []
+    for line in cleaned_text.split('\n'):
+        # 特定のプレフィックス行を削除
+        if line.startswith(_META_PREFIXES):
+            continue
         
-        # 制約・指示に関する表現
-        r'.*一貫した受け答えを行.*',
-        r'.*制約事項に反する.*',
-        r'.*ご留意ください.*',
-        r'.*この設定に基づいて.*',
-        r'.*常に麻理として.*',
-        r'.*キャラクターとして振る舞.*',
-        r'.*キャラクター設定や状況を考えて.*',
-        r'.*会話は非常にデリケートです.*',
-        r'.*相手の感情や状態に配慮.*',
-        r'.*親密度が上がるほど.*',
-        r'.*ユーザーとの信頼関係を築く.*',
-        r'.*落ち着け.*逆効果.*',
-        r'.*言葉選びを心がけて.*',
+        # 制約文・説明文を含む行を削除
+        if any(phrase in line for phrase in _META_LINE_PHRASES) or _has_ordered_phrase(line):
+            continue
         
-        # 説明・解説に関する表現
-        r'.*説明すると.*',
-        r'.*補足すると.*',
-        r'.*注意点として.*',
-        r'.*ポイントは.*',
-        r'.*重要なのは.*',
-        r'.*ここでのポイントは.*',
+        # 敬語表現は最後の出現位置までを削除
+        for ending in _POLITE_ENDINGS:
+            if ending in line:
+                line = line.rpartition(ending)[2]
         
-        # メタ的な言及
-        r'.*キャラクターの設定上.*',
-        r'.*この性格では.*',
-        r'.*このキャラクターは.*',
-        r'.*麻理の性格上.*',
-        r'.*麻理という人物は.*',
-        r'.*麻理の反応として.*',
+        if any(phrase in line for phrase in _META_PROMPT_PHRASES):
+            continue
         
-        # 指示・命令に関する表現
-        r'.*以下の指示に従って.*',
-        r'.*次のように応答してください.*',
-        r'.*このように返答してください.*',
-        r'.*麻理として応答します.*',
-        r'.*麻理の口調で返します.*',
-        r'.*麻理として一貫した.*',
-        r'.*麻理として直接会話.*',
-        r'.*麻理として振る舞.*',
-        r'.*麻理の立場から.*',
-        r'.*麻理の視点で.*',
-        r'.*麻理の人格で.*',
-        r'.*麻理のキャラクターとして.*',
+        # 全角・半角スペースの正規化（連続したスペースを1つに）と行頭・行末の空白除去
+        # （正規化が必要な行はまれなので、部分一致で判定してから正規表現を使う）
+        if '　' in line or '  ' in line:
+            line = _SPACES_RE.sub(' ', line)
+        line = line.strip()
         
-        # 「〜です」「〜ます」などの敬語表現（麻理の口調と不一致）
-        r'.*でしょうか。',
-        r'.*します。',
-        r'.*します',
-        r'.*ください。',
-        r'.*ください',
-        r'.*お願いします。',
-        r'.*お願いします',
-        r'.*いたします。',
-        r'.*いたします',
-        r'.*致します。',
-        r'.*致します',
+        # 空の行を削除
+        if not line:
+            continue
         
-        # システムプロンプト関連の表現
-        r'.*システムプロンプト.*',
-        r'.*プロンプトに従って.*',
-        r'.*プロンプトに基づいて.*',
-        r'.*設定に従って.*',
-        r'.*設定に基づいて.*',
-        r'.*指示に従って.*',
-        r'.*指示に基づいて.*',
-        r'.*キャラクター設定に基づいて.*',
-        r'.*キャラクター設定に従って.*'
-    ]
-    
-    for pattern in removal_phrases:
-        cleaned_text = re.sub(pattern, '', cleaned_text, flags=re.MULTILINE)
-    
-    # 空行の正規化と前後トリム
-    cleaned_text = re.sub(r'\n\s*\n', '\n', cleaned_text)
-    cleaned_text = re.sub(r'^\s*$\n', '', cleaned_text, flags=re.MULTILINE)
-    
-    # 全角・半角スペースの正規化（連続したスペースを1つに）
-    cleaned_text = re.sub(r'[ 　]+', ' ', cleaned_text).strip()
-    
-    # 行頭・行末の空白を削除
-    cleaned_text = '\n'.join([line.strip() for line in cleaned_text.split('\n')])
-    
-    # 空の行を削除
-    cleaned_text = '\n'.join([line for line in cleaned_text.split('\n') if line.strip()])
+        kept_lines.append(line)
+        # 上限行数制限 - 長すぎる応答を防止
+        if len(kept_lines) >= _MAX_RESPONSE_LINES:
+            break
     
-    # 上限行数制限（5行まで）- 長すぎる応答を防止
-    lines = cleaned_text.split('\n')
-    if len(lines) > 5:
-        cleaned_text = '\n'.join(lines[:5])
-    
-    # 最終的な空白除去
-    cleaned_text = cleaned_text.strip()
+    cleaned_text = '\n'.join(kept_lines)
     
     # 空の場合はデフォルトメッセージ
     if not cleaned_text:
-        cleaned_text = "チッ、うっせーな..."
+        cleaned_text = _EMPTY_RESPONSE_FALLBACK
     
     return cleaned_text
 
 
 # --- ロギング設定 ---
-log_filename = f"chat_log_{datetime.now().strftime('%Y-%m-%d')}.txt"
+log_filename = "chat_log.txt"
+log_format = '%(asctime)s - %(message)s'
+LOG_BACKUP_DAYS = 14  # 保持する過去ログの日数
+
+def _gzip_log_rotator(source: str, dest: str) -> None:
+    """ローテーションした過去ログをgzip圧縮して保存する"""
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+# 日付が変わるたびに新しいファイルへ切り替え、過去ログは圧縮して一定日数だけ残す
+# ファイルへの書き込みは100件ずつまとめて行う（ERROR以上は即座に書き出す）
+log_file_handler = logging.handlers.TimedRotatingFileHandler(
+    log_filename, when='midnight', backupCount=LOG_BACKUP_DAYS, encoding='utf-8', delay=True
+)
+log_file_handler.namer = lambda name: name + ".gz"
+log_file_handler.rotator = _gzip_log_rotator
+log_file_handler.setFormatter(logging.Formatter(log_format))
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(logging.Formatter(log_format))
+# 実際の出力はバックグラウンドスレッドで行い、リクエスト処理中にディスクI/Oを待たないようにする
+log_queue_listener = logging.handlers.QueueListener(
+    queue.SimpleQueue(),
+    logging.handlers.MemoryHandler(capacity=100, flushLevel=logging.ERROR, target=log_file_handler),
+    log_stream_handler
+)
+log_queue_handler = logging.handlers.QueueHandler(log_queue_listener.queue)
+# 書式は出力側のハンドラで適用するので、キューにはメッセージ本文だけを載せる
+log_queue_handler.setFormatter(logging.Formatter('%(message)s'))
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_filename, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+    format=log_format,
+    handlers=[log_queue_handler]
 )
+log_queue_listener.start()
+# 終了時にキューに残ったログを書き出す
+atexit.register(log_queue_listener.stop)
 
 # --- 型定義 ---
 ChatHistory = List[Tuple[str, str]]
@@ -230,6 +270,8 @@ DEFAULT_PORT = 10000
 # Google Generative AI設定
 genai.configure(api_key=GOOGLE_API_KEY)
 PORT = int(os.environ.get("PORT", DEFAULT_PORT))
+# 同時に処理するチャットリクエスト数の上限（Gradioの既定値1では他のユーザーの応答待ちで詰まる）
+CHAT_CONCURRENCY_LIMIT = int(os.environ.get("CHAT_CONCURRENCY_LIMIT", 16))
 
 system_prompt = """\
 # 麻理の人格設定
@@ -337,6 +379,8 @@ system_prompt = """\
 storage_dir = os.path.join(os.path.dirname(__file__), "sessions")
 session_manager, affection_tracker = initialize_affection_system(storage_dir)
 prompt_generator = TsundereAwarePromptGenerator(system_prompt)
+# ツンデレ検出器はプロンプト生成器が保持するものを共有する（毎ターン作り直さない）
+tsundere_detector = prompt_generator.tsundere_detector
 
 # Initialize usage statistics
 initialize_usage_statistics(storage_dir)
@@ -345,19 +389,33 @@ initialize_usage_statistics(storage_dir)
 logging.getLogger('tsundere_sentiment_detector').setLevel(logging.INFO)
 
 # --- 安全なhistory処理 ---
+def _is_chat_turn(h: Any) -> bool:
+    """(str, str) の2要素タプルかどうか"""
+    return type(h) is tuple and len(h) == 2 and type(h[0]) is str and type(h[1]) is str
+
 def safe_history(history: Any) -> ChatHistory:
     """あらゆる型のhistoryを安全にChatHistoryに変換"""
+    if isinstance(history, list) and all(map(_is_chat_turn, history)):
+        # 既にChatHistory形式なら、新しいリストを作らずにそのまま返す（呼び出し側は変更しない）
+        return history
     if isinstance(history, (list, tuple)):
         return [(str(h[0]), str(h[1])) for h in history if len(h) >= 2]
     return []
 
+# 会話履歴をモデルに送るかどうか（既定では従来どおり送らず、毎ターンを単発の呼び出しにする）
+SEND_CHAT_HISTORY = os.environ.get("SEND_CHAT_HISTORY", "0") == "1"
+# 会話履歴を送る場合の上限（古いものから切り捨てる）
+MAX_HISTORY_TURNS = 8  # 直近何往復までを送るか
+MAX_HISTORY_CHARS = 4000  # 履歴全体の文字数の目安（トークン数の代わりに文字数で近似）
+
 def build_messages(history: ChatHistory, user_input: str, system_prompt: str) -> List[dict]:
     """
     会話履歴とユーザー入力からメッセージリストを構築する
     システムプロンプト（人格設定）を常にコンテキストの先頭に配置
+    会話履歴は直近MAX_HISTORY_TURNS往復・MAX_HISTORY_CHARS文字までに制限する
     
     Args:
-        history: 会話履歴
+        history: 会話履歴（safe_historyで正規化済みのもの）
         user_input: ユーザーの入力
         system_prompt: システムプロンプト（人格設定）
         
@@ -367,10 +425,21 @@ def build_messages(history: ChatHistory, user_input: str, system_prompt: str) ->
     # システムプロンプトを常にコンテキストの先頭に配置
     messages = [{"role": "system", "content": system_prompt}]
     
-    # 会話履歴を追加
-    for u, a in history:
-        messages.append({"role": "user", "content": str(u)})
-        messages.append({"role": "assistant", "content": str(a)})
+    # 新しい順に履歴をたどり、上限に収まる分だけを残す
+    recent_turns = []
+    total_chars = 0
+    for u, a in reversed(history[-MAX_HISTORY_TURNS:]):
+        total_chars += len(u) + len(a)
+        if recent_turns and total_chars > MAX_HISTORY_CHARS:
+            break
+        recent_turns.append((u, a))
+    
+    # 会話履歴を古い順に追加（historyはsafe_historyで文字列のペアに揃えてあるのでstr()は不要）
+    messages.extend(
+        message
+        for u, a in reversed(recent_turns)
+        for message in ({"role": "user", "content": u}, {"role": "assistant", "content": a})
+    )
     
     # 最新のユーザー入力を追加
     messages.append({"role": "user", "content": user_input})
@@ -452,53 +521,136 @@ class GeminiChatManager:
 # グローバルなGeminiチャットマネージャーのインスタンスを作成
 gemini_chat_manager = GeminiChatManager()
 
-def call_gemini_api(messages: List[dict], session_id: str = None) -> str:
+# Gemini APIのタイムアウトと再試行の設定
+GEMINI_REQUEST_TIMEOUT = 60  # 1回のリクエストのタイムアウト（秒）
+GEMINI_MAX_RETRIES = 2  # 一時的なエラー時の再試行回数
+GEMINI_RETRY_BACKOFF = 0.5  # 再試行までの待ち時間の初期値（秒、再試行ごとに倍増）
+# 再試行の対象とする一時的なエラー（429/500/503/504）
+_GEMINI_RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.InternalServerError,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+)
+
+# ストリーミング応答の途中経過をまとめる設定
+STREAM_MAX_BATCH_SIZE = 8  # 1回の途中経過にまとめる最大チャンク数
+STREAM_FLUSH_INTERVAL = 0.25  # この秒数が経過したらチャンク数に関係なく途中経過を出す
+
+async def _start_gemini_stream(user_message: str, system_content: str, session_id: str = None,
+                               history_contents: Optional[List[dict]] = None):
+    """
+    Gemini APIへのストリーミングリクエストを開始する
+    一時的なエラーの場合は間隔を空けて再試行する
+    
+    Args:
+        user_message: 送信するユーザーメッセージ
+        system_content: システムプロンプト
+        session_id: ユーザーセッションID（指定時はGeminiのチャットセッションが履歴を保持する）
+        history_contents: セッションIDがない場合に一緒に送る会話履歴（Gemini形式）
+        
+    Returns:
+        ストリーミング応答オブジェクト
+    """
+    request_options = {"timeout": GEMINI_REQUEST_TIMEOUT}
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            if session_id:
+                # チャットセッションを取得または作成し、メッセージを送信して応答を取得
+                # （送信に失敗した場合、チャットセッションの履歴は変更されない）
+                chat_session = gemini_chat_manager.get_chat_session(session_id, system_content)
+                return await chat_session.send_message_async(
+                    user_message, stream=True, request_options=request_options
+                )
+            # セッションIDがない場合は使い捨てのチャットセッションを作らず、
+            # キャッシュ済みのモデル（とそのAPIクライアントの接続）を再利用し、
+            # 会話履歴と最新のユーザー入力をまとめて送って生成する
+            contents = [*history_contents, {"role": "user", "parts": [user_message]}] if history_contents else user_message
+            return await gemini_chat_manager.get_model(system_content).generate_content_async(
+                contents, stream=True, request_options=request_options
+            )
+        except _GEMINI_RETRYABLE_ERRORS as e:
+            if attempt >= GEMINI_MAX_RETRIES:
+                raise
+            delay = GEMINI_RETRY_BACKOFF * (2 ** attempt)
+            logging.warning(f"Gemini API一時エラーのため{delay}秒後に再試行します ({attempt + 1}/{GEMINI_MAX_RETRIES}): {str(e)}")
+            await asyncio.sleep(delay)
+
+async def stream_gemini_api(messages: List[dict], session_id: str = None) -> AsyncIterator[str]:
     """
-    Google Gemini APIを呼び出して応答を取得する
+    Google Gemini APIをストリーミングで呼び出し、受信済みの応答テキストを逐次返す
     
     Args:
         messages: APIに送信するメッセージリスト
         session_id: ユーザーセッションID
         
-    Returns:
-        APIからの応答テキスト
+    Yields:
+        その時点までに受信した応答テキスト（累積）
     """
     try:
         # システムプロンプトを抽出
         system_content = None
         user_message = None
+        history_contents = []
         
         for msg in messages:
             if msg["role"] == "system":
                 system_content = msg["content"]
-            elif msg["role"] == "user" and msg == messages[-1]:
+            elif msg["role"] == "user" and msg is messages[-1]:
                 # 最後のユーザーメッセージを取得
                 user_message = msg["content"]
+            elif msg["content"]:
+                # それまでの会話履歴（assistantはGeminiではmodelロール）
+                role = "model" if msg["role"] == "assistant" else "user"
+                history_contents.append({"role": role, "parts": [msg["content"]]})
         
         if not system_content or not user_message:
             logging.error("システムプロンプトまたはユーザーメッセージが見つかりません")
-            return "チッ、なんか変だな..."
+            yield "チッ、なんか変だな..."
+            return
         
-        # セッションIDがない場合は一時的なIDを生成
-        if not session_id:
-            session_id = f"temp_{uuid.uuid4()}"
+        response = await _start_gemini_stream(user_message, system_content, session_id, history_contents)
         
-        # チャットセッションを取得または作成
-        chat_session = gemini_chat_manager.get_chat_session(session_id, system_content)
+        text = ""
+        async for chunk in response:
+            try:
+                chunk_text = chunk.text
+            except ValueError:
+                # テキストを含まないチャンク（安全性フィルタなど）は読み飛ばす
+                continue
+            if chunk_text:
+                text += chunk_text
+                yield text
         
-        # メッセージを送信して応答を取得
-        response = chat_session.send_message(user_message)
-        
-        return response.text
+        if not text:
+            # 1文字も得られなかった場合は、通常の応答と同様に text を参照してエラーを発生させる
+            yield response.text
     except Exception as e:
         logging.error(f"Gemini API呼び出しエラー: {str(e)}")
         if hasattr(e, 'response') and e.response:
             logging.error(f"レスポンス: {e.response}")
-        return "チッ、調子悪いみたいだな..."
+        yield "チッ、調子悪いみたいだな..."
 
-def chat(user_input: str, system_prompt: str, history: Any = None, session_id: Optional[str] = None) -> Tuple[str, ChatHistory]:
+async def call_gemini_api(messages: List[dict], session_id: str = None) -> str:
     """
-    Enhanced chat function with affection system integration
+    Google Gemini APIを非同期に呼び出して応答を取得する（待機中もイベントループをブロックしない）
+    
+    Args:
+        messages: APIに送信するメッセージリスト
+        session_id: ユーザーセッションID
+        
+    Returns:
+        APIからの応答テキスト
+    """
+    text = ""
+    async for text in stream_gemini_api(messages, session_id):
+        pass
+    return text
+
+async def chat_stream(user_input: str, system_prompt: str, history: Any = None,
+                      session_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Optional[ChatHistory]]]:
+    """
+    Enhanced chat function with affection system integration, streaming the response
     
     Args:
         user_input: The user's message
@@ -506,18 +658,24 @@ def chat(user_input: str, system_prompt: str, history: Any = None, session_id: O
         history: Chat history
         session_id: User session ID for affection tracking
         
-    Returns:
-        Tuple of (assistant_response, updated_history)
+    Yields:
+        (partial_response, None) while the response is being generated, then
+        (assistant_response, updated_history) once it is complete
     """
     safe_hist = safe_history(history) if history is not None else []
     
     if not user_input.strip():
-        return "", safe_hist
+        yield "", safe_hist
+        return
 
     try:
+        # 1ターン中に何度も使うため、グローバルな取得関数の結果をローカル変数に束縛しておく
+        sm = get_session_manager()
+        at = get_affection_tracker()
+        
         # Create or get session if not provided
-        if not session_id and get_session_manager():
-            session_id = get_session_manager().create_new_session()
+        if not session_id and sm:
+            session_id = sm.create_new_session()
             logging.info(f"Created new session in chat function: {session_id}")
         
         # Convert chat history to format expected by tsundere detector
@@ -530,22 +688,20 @@ def chat(user_input: str, system_prompt: str, history: Any = None, session_id: O
             })
         
         # Analyze user input with tsundere awareness before updating affection
-        from tsundere_sentiment_detector import TsundereSentimentDetector
-        tsundere_detector = TsundereSentimentDetector()
         tsundere_analysis = tsundere_detector.analyze_with_tsundere_awareness(
             user_input, session_id, conversation_history
         )
         
         # Use the tsundere-adjusted affection delta instead of the raw sentiment analysis
-        if session_id and get_affection_tracker() and get_session_manager():
+        if session_id and at and sm:
             # Get current affection level
-            current_affection = get_session_manager().get_affection_level(session_id)
+            current_affection = sm.get_affection_level(session_id)
             
-            # Apply the tsundere-adjusted affection delta
+            # Apply the tsundere-adjusted affection delta (returns the new level)
             adjusted_delta = tsundere_analysis["final_affection_delta"]
-            get_session_manager().update_affection(session_id, adjusted_delta)
-            
-            new_affection = get_session_manager().get_affection_level(session_id)
+            new_affection = sm.update_affection(session_id, adjusted_delta)
+            if new_affection is None:
+                new_affection = sm.get_affection_level(session_id)
             
             # Log the tsundere-aware affection update
             logging.info(f"Updated affection with tsundere awareness for session {session_id}: "
@@ -556,11 +712,11 @@ def chat(user_input: str, system_prompt: str, history: Any = None, session_id: O
             tsundere_context = tsundere_analysis.get("llm_context", {})
             
             # Get dynamic system prompt with tsundere awareness
-            affection_level = get_session_manager().get_affection_level(session_id)
+            affection_level = new_affection
             dynamic_prompt = prompt_generator.generate_dynamic_prompt(affection_level, tsundere_context)
             
             # Get relationship stage for logging
-            relationship_stage = get_affection_tracker().get_relationship_stage(affection_level)
+            relationship_stage = at.get_relationship_stage(affection_level)
             logging.info(f"Using tsundere-aware prompt for session {session_id} with affection level {affection_level} "
                         f"(relationship stage: {relationship_stage})")
         else:
@@ -572,47 +728,84 @@ def chat(user_input: str, system_prompt: str, history: Any = None, session_id: O
         enhanced_user_input = user_input
         
         # Build messages for the model - 常にdynamic_promptをシステムプロンプトとして使用
-        messages = build_messages(safe_hist, enhanced_user_input, dynamic_prompt)
+        # 会話履歴はSEND_CHAT_HISTORYが有効な場合のみ、build_messagesで直近の分だけに制限して送る
+        messages = build_messages(safe_hist if SEND_CHAT_HISTORY else [], enhanced_user_input, dynamic_prompt)
         
         # デバッグ用：メッセージの内容をログに記録
-        logging.debug(f"Preparing messages for model: {json.dumps(messages, ensure_ascii=False)[:500]}...")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Preparing messages for model: {orjson.dumps(messages).decode('utf-8')[:500]}...")
         
-        # Gemini APIを使用して推論を実行
+        # Gemini APIを使用して推論を実行（受信した分から途中経過として返す）
         logging.info(f"Generating response with Gemini API using {MODEL_NAME}")
-        api_response = call_gemini_api(messages)
+        # 途中経過はチャンクをまとめて出す（最初の1チャンクはすぐに出し、以降はまとめる数を倍々に増やす）
+        api_response = ""
+        batch_size = 1
+        pending_chunks = 0
+        last_flush = time.monotonic()
+        async for api_response in stream_gemini_api(messages):
+            pending_chunks += 1
+            if pending_chunks < batch_size and time.monotonic() - last_flush < STREAM_FLUSH_INTERVAL:
+                continue
+            pending_chunks = 0
+            batch_size = min(batch_size * 2, STREAM_MAX_BATCH_SIZE)
+            last_flush = time.monotonic()
+            
+            partial_response = clean_meta(api_response)
+            # まだメタ情報しか届いていない間は途中経過を出さない
+            if partial_response != _EMPTY_RESPONSE_FALLBACK:
+                yield partial_response, None
         
         # デバッグ用：レスポンスの一部をログに記録
         logging.debug(f"Generated response: {api_response[:100]}...")
         
-        # クリーニング関数を適用して、メタ情報を削除
+        # クリーニング関数を完成した応答全体に適用して、メタ情報を削除
         api_response = clean_meta(api_response)
         
         # Update conversation history in session
-        if session_id and get_session_manager():
-            get_session_manager().update_conversation_history(session_id, user_input, api_response)
+        if session_id and sm:
+            sm.update_conversation_history(session_id, user_input, api_response)
             
             # UI側の会話履歴も同期させる
             # セッションから最新の会話履歴を取得
-            session = get_session_manager().get_session(session_id)
+            session = sm.get_session(session_id)
             if session:
                 # セッションの会話履歴をUI形式に変換
                 ui_history = []
                 for entry in session.conversation_history:
                     if 'user' in entry and 'assistant' in entry:
                         ui_history.append((entry['user'], entry['assistant']))
-                return api_response, ui_history
+                yield api_response, ui_history
+                return
         
         # セッションがない場合は通常通り履歴を更新
         updated_history = safe_hist + [(user_input, api_response)]
-        return api_response, updated_history
+        yield api_response, updated_history
 
     except Exception as e:
         error_msg = f"エラーが発生しました: {str(e)}"
-        logging.error(error_msg)
-        logging.exception("Exception details:")
-        return error_msg, safe_hist
+        # メッセージとスタックトレースを1件のログとして出力する
+        logging.exception(error_msg)
+        yield error_msg, safe_hist
+
+async def chat(user_input: str, system_prompt: str, history: Any = None, session_id: Optional[str] = None) -> Tuple[str, ChatHistory]:
+    """
+    Enhanced chat function with affection system integration
+    
+    Args:
+        user_input: The user's message
+        system_prompt: Base system prompt
+        history: Chat history
+        session_id: User session ID for affection tracking
+        
+    Returns:
+        Tuple of (assistant_response, updated_history)
+    """
+    result = ("", safe_history(history) if history is not None else [])
+    async for result in chat_stream(user_input, system_prompt, history, session_id):
+        pass
+    return result
 
-def on_submit(msg: str, history: ChatHistory, session_id: str = None, relationship_info: dict = None):
+async def on_submit(msg: str, history: ChatHistory, session_id: str = None, relationship_info: dict = None):
     """
     Enhanced handle user message submission with improved session management
     
@@ -622,29 +815,36 @@ def on_submit(msg: str, history: ChatHistory, session_id: str = None, relationsh
         session_id: User session ID for affection tracking
         relationship_info: Current relationship information
         
-    Returns:
-        Tuple of (empty_input, updated_chatbot, updated_history, session_id, relationship_info)
+    Yields:
+        Tuple of (empty_input, updated_chatbot, updated_history, session_id, relationship_info).
+        While the response streams in, updated_history is None and updated_chatbot
+        shows the partial response; the last tuple carries the final state.
     """
+    sm = get_session_manager()
+    at = get_affection_tracker()
+    
     # Check for stored session ID in browser localStorage or create a new one
-    if not session_id and get_session_manager():
+    if not session_id and sm:
         # First try to create a new session
-        session_id = get_session_manager().create_new_session()
+        session_id = sm.create_new_session()
         logging.info(f"Created new session: {session_id}")
     
     # Get response using dynamic prompt with session ID for affection tracking
-    response, updated_history = chat(msg, system_prompt, history, session_id)
+    base_history = safe_history(history) if history is not None else []
+    async for response, updated_history in chat_stream(msg, system_prompt, history, session_id):
+        if updated_history is None:
+            # 途中経過: 生成中の応答をチャット欄にだけ反映する
+            yield "", base_history + [(msg, response)], None, session_id, relationship_info
     
-    # Save session state after each interaction
-    if session_id and get_session_manager():
-        get_session_manager().save_session(session_id)
-        logging.debug(f"Saved session state for session {session_id}")
-        
+    # セッションの変更は更新のたびにSessionManagerが永続化（差分ログ＋バックグラウンド書き込み）
+    # しているので、ここでの保存は不要
+    if session_id and sm:
         # Update relationship info for UI display
-        if get_affection_tracker():
-            affection_level = get_session_manager().get_affection_level(session_id)
-            relationship_info = get_affection_tracker().get_mari_behavioral_state(affection_level)
+        if at:
+            affection_level = sm.get_affection_level(session_id)
+            relationship_info = copy_behavioral_state(at.get_mari_behavioral_state(affection_level))
     
-    return "", updated_history, updated_history, session_id, relationship_info
+    yield "", updated_history, updated_history, session_id, relationship_info
 
 def clear_history():
     """Clear chat history and session data"""
@@ -670,6 +870,8 @@ manifest_data = {
     "orientation": "portrait",
     "lang": "ja-JP"
 }
+# 内容は固定なので、起動時に一度だけJSONへエンコードしておく
+manifest_bytes = orjson.dumps(manifest_data)
 
 # FastAPIアプリ
 app = FastAPI(root_path="")
@@ -677,6 +879,9 @@ app = FastAPI(root_path="")
 # 静的ファイルの配信設定
 app.mount("/assets", StaticFiles(directory="assets", html=True), name="assets")
 
+# セッション管理スクリプトのバージョン（更新時刻）。内容が変わったときだけブラウザのキャッシュを更新させる
+SESSION_MANAGER_JS_VERSION = int(os.path.getmtime(os.path.join("assets", "session_manager.js")))
+
 # ルートパスへのアクセスを/uiにリダイレクト
 @app.get("/")
 async def redirect_to_ui():
@@ -686,7 +891,7 @@ async def redirect_to_ui():
 # マニフェスト配信エンドポイント
 @app.get("/manifest.json")
 async def get_manifest():
-    return JSONResponse(manifest_data)
+    return Response(content=manifest_bytes, media_type="application/json")
 
 # Gradioインターフェースの定義
 # Gradioインターフェースの定義
@@ -820,7 +1025,8 @@ with gr.Blocks(theme=theme, css=custom_css, title="麻理チャット") as demo:
     # マニフェストとJavaScriptを埋め込み
     # タイムスタンプをクエリパラメータとして追加してキャッシュを回避
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    gr.HTML("""
+    # セッション管理スクリプトは静的ファイルとして配信し、内容が変わるまでブラウザにキャッシュさせる
+    gr.HTML(f"""
             <script src="assets/affection_gauge.js?v={timestamp}"></script>
             <script>
             // URLの末尾スラッシュを削除して二重スラッシュを防ぐ
@@ -828,169 +1034,8 @@ with gr.Blocks(theme=theme, css=custom_css, title="麻理チャット") as demo:
             window.src = "{RENDER_EXTERNAL_URL}/ui";
             window.space = "{RENDER_EXTERNAL_URL}/ui";
             window.location.origin = "{RENDER_EXTERNAL_URL}";
-            
-            // URLパスを結合する関数（二重スラッシュを防ぐ）
-            window.joinPaths = function(base, path) {{
-                // nullやundefinedのチェック
-                if (!base) return path || '';
-                if (!path) return base || '';
-                
-                // 文字列に変換
-                base = String(base);
-                path = String(path);
-                
-                // 末尾のスラッシュを削除
-                while (base.endsWith('/')) {{
-                    base = base.slice(0, -1);
-                }}
-                
-                // 先頭のスラッシュを削除
-                while (path.startsWith('/')) {{
-                    path = path.slice(1);
-                }}
-                
-                // 空の場合の処理
-                if (base === '' && path === '') return '/';
-                if (base === '') return '/' + path;
-                if (path === '') return base;
-                
-                return base + '/' + path;
-            }};
-            
-            // Enhanced session management with localStorage
-            window.mariSessionManager = {{
-                // Save all session data to localStorage
-                saveSessionData: function(sessionId, affectionLevel, relationshipStage) {{
-                    if (sessionId) {{
-                        localStorage.setItem('mari_session_id', sessionId);
-                        
-                        if (affectionLevel !== undefined) {{
-                            localStorage.setItem('mari_affection_level', affectionLevel);
-                        }}
-                        
-                        if (relationshipStage !== undefined) {{
-                            localStorage.setItem('mari_relationship_stage', relationshipStage);
-                        }}
-                        
-                        localStorage.setItem('mari_last_interaction', new Date().toISOString());
-                        console.log('Saved session data to localStorage:', {{ 
-                            sessionId, 
-                            affectionLevel, 
-                            relationshipStage,
-                            timestamp: new Date().toISOString()
-                        }});
-                        return true;
-                    }}
-                    return false;
-                }},
-                
-                // Clear all session data from localStorage
-                clearSessionData: function() {{
-                    localStorage.removeItem('mari_session_id');
-                    localStorage.removeItem('mari_affection_level');
-                    localStorage.removeItem('mari_relationship_stage');
-                    localStorage.removeItem('mari_last_interaction');
-                    console.log('Cleared all session data from localStorage');
-                }},
-                
-                // Check if session is expired (older than 30 days)
-                isSessionExpired: function() {{
-                    const lastInteraction = localStorage.getItem('mari_last_interaction');
-                    if (!lastInteraction) return true;
-                    
-                    const lastDate = new Date(lastInteraction);
-                    const now = new Date();
-                    const daysDiff = (now - lastDate) / (1000 * 60 * 60 * 24);
-                    
-                    return daysDiff > 30;
-                }}
-            }};
-            
-            // Store session ID in localStorage for persistence across page reloads
-            window.addEventListener('load', function() {{
-                const storedSessionId = localStorage.getItem('mari_session_id');
-                
-                // Check if we have a stored session and it's not expired
-                if (storedSessionId && !window.mariSessionManager.isSessionExpired()) {{
-                    console.log('Restored session ID from localStorage:', storedSessionId);
-                    
-                    // We'll update the session_state component after the page loads
-                    setTimeout(() => {{
-                        // Find the hidden session state component and update it
-                        const sessionStateComponents = document.querySelectorAll('input[data-testid]');
-                        for (const component of sessionStateComponents) {{
-                            if (component.parentElement.textContent.includes('session_state')) {{
-                                component.value = storedSessionId;
-                                
-                                // Create and dispatch change event to notify Gradio
-                                const event = new Event('input', {{ bubbles: true }});
-                                component.dispatchEvent(event);
-                                
-                                console.log('Updated session state component with stored ID:', storedSessionId);
-                                
-                                // Trigger session restoration
-                                window.dispatchEvent(new CustomEvent('mari_restore_session', {{
-                                    detail: {{ 
-                                        sessionId: storedSessionId,
-                                        affectionLevel: localStorage.getItem('mari_affection_level'),
-                                        relationshipStage: localStorage.getItem('mari_relationship_stage')
-                                    }}
-                                }}));
-                                break;
-                            }}
-                        }}
-                    }}, 1000);
-                }} else if (storedSessionId && window.mariSessionManager.isSessionExpired()) {{
-                    // Clear expired session data
-                    console.log('Found expired session, clearing data');
-                    window.mariSessionManager.clearSessionData();
-                }}
-            }});
-            
-            // Periodically update last interaction time while the page is open
-            setInterval(function() {{
-                const sessionId = localStorage.getItem('mari_session_id');
-                if (sessionId) {{
-                    localStorage.setItem('mari_last_interaction', new Date().toISOString());
-                }}
-            }}, 60000); // Update every minute
-            
-            // Handle stage change notifications
-            document.addEventListener('DOMContentLoaded', function() {
-                // Set up a mutation observer to watch for changes to the stage notification
-                const observer = new MutationObserver(function(mutations) {
-                    mutations.forEach(function(mutation) {
-                        if (mutation.type === 'childList') {
-                            const stageNotification = document.querySelector('.stage-change-notification');
-                            if (stageNotification) {
-                                // If content is empty, hide the notification
-                                if (!stageNotification.textContent || stageNotification.textContent.trim() === '') {
-                                    stageNotification.style.display = 'none';
-                                } else {
-                                    // Show notification with animation
-                                    stageNotification.style.display = 'block';
-                                    // Reset animation
-                                    stageNotification.style.animation = 'none';
-                                    stageNotification.offsetHeight; // Trigger reflow
-                                    stageNotification.style.animation = 'fadeInOut 5s ease-in-out forwards';
-                                    
-                                    // Hide after animation completes
-                                    setTimeout(function() {
-                                        stageNotification.style.display = 'none';
-                                    }, 5000);
-                                }
-                            }
-                        }
-                    });
-                });
-                
-                // Start observing the stage notification element
-                const stageNotificationElement = document.querySelector('.stage-change-notification');
-                if (stageNotificationElement) {
-                    observer.observe(stageNotificationElement, { childList: true, subtree: true });
-                }
-            });
             </script>
+            <script src="assets/session_manager.js?v={SESSION_MANAGER_JS_VERSION}"></script>
             <link rel="manifest" href="manifest.json">
     """)
 
@@ -1038,17 +1083,19 @@ with gr.Blocks(theme=theme, css=custom_css, title="麻理チャット") as demo:
         Returns:
             Tuple of (session_id, affection_level, relationship_stage, relationship_info, stage_change_notification)
         """
-        if not session_id or not get_session_manager() or not get_affection_tracker():
+        sm = get_session_manager()
+        at = get_affection_tracker()
+        if not session_id or not sm or not at:
             return session_id, 25, "distant", {}, ""
         
         # Get current affection level
-        affection_level = get_session_manager().get_affection_level(session_id)
+        affection_level = sm.get_affection_level(session_id)
         
         # Get relationship stage
-        relationship_stage = get_affection_tracker().get_relationship_stage(affection_level)
+        relationship_stage = at.get_relationship_stage(affection_level)
         
         # Get relationship info
-        relationship_info = get_affection_tracker().get_mari_behavioral_state(affection_level)
+        relationship_info = copy_behavioral_state(at.get_mari_behavioral_state(affection_level, relationship_stage))
         
         # Check for stage change and prepare notification
         stage_change_notification = ""
@@ -1168,14 +1215,18 @@ with gr.Blocks(theme=theme, css=custom_css, title="麻理チャット") as demo:
             }
     
     # Modified on_submit to update session info
-    def on_submit_with_info(msg, history, session_id, rel_info=None):
-        """Enhanced on_submit that also updates session info display"""
-        empty_input, updated_chatbot, updated_history, new_session_id, updated_rel_info = on_submit(msg, history, session_id, rel_info)
+    async def on_submit_with_info(msg, history, session_id, rel_info=None):
+        """Enhanced on_submit that also updates session info display (streams the response)"""
+        async for empty_input, updated_chatbot, updated_history, new_session_id, updated_rel_info in on_submit(msg, history, session_id, rel_info):
+            if updated_history is None:
+                # 生成中はチャット欄のみ更新し、他の表示はそのままにする
+                yield (empty_input, updated_chatbot, gr.update(), gr.update(), gr.update(),
+                       gr.update(), gr.update(), gr.update(), gr.update(), gr.update())
         
         # Update session info display
         session_id_display, affection_level, relationship_stage, rel_info, stage_notification, rel_details = update_session_info(new_session_id)
         
-        return empty_input, updated_chatbot, updated_history, new_session_id, session_id_display, affection_level, relationship_stage, rel_info, stage_notification, rel_details
+        yield empty_input, updated_chatbot, updated_history, new_session_id, session_id_display, affection_level, relationship_stage, rel_info, stage_notification, rel_details
     
     # Modified clear_history to reset session info
     def clear_history_with_info():
@@ -1190,14 +1241,19 @@ with gr.Blocks(theme=theme, css=custom_css, title="麻理チャット") as demo:
                      outputs=[user_input, chatbot, state, session_state, 
                              session_id_display, affection_level_display, 
                              relationship_stage_display, relationship_info,
-                             stage_change_notification, relationship_details])
+                             stage_change_notification, relationship_details],
+                     # 送信ボタンとEnterキーで同じ同時実行枠を共有する
+                     concurrency_limit=CHAT_CONCURRENCY_LIMIT,
+                     concurrency_id="chat")
     
     submit_btn.click(on_submit_with_info, 
                     inputs=[user_input, state, session_state, relationship_info], 
                     outputs=[user_input, chatbot, state, session_state, 
                             session_id_display, affection_level_display, 
                             relationship_stage_display, relationship_info,
-                            stage_change_notification, relationship_details])
+                            stage_change_notification, relationship_details],
+                    concurrency_limit=CHAT_CONCURRENCY_LIMIT,
+                    concurrency_id="chat")
     
     clear_btn.click(clear_history_with_info, 
                    outputs=[chatbot, state, session_state, 
@@ -1213,23 +1269,24 @@ with gr.Blocks(theme=theme, css=custom_css, title="麻理チャット") as demo:
     # Function to restore session from localStorage
     def restore_session(session_id):
         """Restore session from localStorage or create new if not exists"""
-        if not session_id and get_session_manager():
+        sm = get_session_manager()
+        if not session_id and sm:
             # Try to load from localStorage via JavaScript
             return None, [], [], {}
         
         # If we have a session ID, try to load the session
-        if session_id and get_session_manager():
-            session = get_session_manager().get_session(session_id)
+        if session_id and sm:
+            session = sm.get_session(session_id)
             if session:
                 try:
                     # Check if session is expired (older than 30 days)
-                    last_interaction = datetime.fromisoformat(session.last_interaction)
+                    last_interaction = session.last_interaction_dt
                     days_since_interaction = (datetime.now() - last_interaction).days
                     
                     if days_since_interaction > 30:
                         logging.info(f"Session {session_id} expired ({days_since_interaction} days old)")
                         # Create new session instead of using expired one
-                        new_session_id = get_session_manager().create_new_session()
+                        new_session_id = sm.create_new_session()
                         logging.info(f"Created new session to replace expired one: {new_session_id}")
                         return new_session_id, [], [], {}
                     
@@ -1248,66 +1305,10 @@ with gr.Blocks(theme=theme, css=custom_css, title="麻理チャット") as demo:
                     logging.error(f"Error parsing session data: {str(e)}")
         
         # If session not found or invalid, create new
-        new_session_id = get_session_manager().create_new_session() if get_session_manager() else None
+        new_session_id = sm.create_new_session() if sm else None
         logging.info(f"Created new session during restoration: {new_session_id}")
         return new_session_id, [], [], {}
     
-     # セッション復元のためのカスタムJavaScriptを埋め込み
-    gr.HTML("""
-    <script>
-    document.addEventListener('DOMContentLoaded', function() {
-        console.log("DOM loaded, initializing session restoration...");
-        
-        // セッション復元関数
-        function restoreSession() {
-            const storedSessionId = localStorage.getItem('mari_session_id');
-            const affectionLevel = localStorage.getItem('mari_affection_level');
-            const relationshipStage = localStorage.getItem('mari_relationship_stage');
-            
-            if (storedSessionId) {
-                console.log("Attempting to restore session:", storedSessionId);
-                console.log("Affection level:", affectionLevel);
-                console.log("Relationship stage:", relationshipStage);
-                
-                // カスタムイベントを発行
-                window.dispatchEvent(new CustomEvent('mari_restore_session', {
-                    detail: { 
-                        sessionId: storedSessionId,
-                        affectionLevel: affectionLevel || '0',
-                        relationshipStage: relationshipStage || 'stranger'
-                    }
-                }));
-                
-                return true;
-            } else {
-                console.log("No stored session found, creating new session");
-                return false;
-            }
-        }
-        
-        // 1.5秒後にセッション復元を試行
-        setTimeout(function() {
-            restoreSession();
-        }, 1500);
-        
-        // セッション保存関数（他の場所から呼び出し可能）
-        window.saveMariSession = function(sessionId, affectionLevel, relationshipStage) {
-            localStorage.setItem('mari_session_id', sessionId);
-            localStorage.setItem('mari_affection_level', affectionLevel);
-            localStorage.setItem('mari_relationship_stage', relationshipStage);
-            console.log("Session saved:", sessionId);
-        };
-        
-        // セッションクリア関数
-        window.clearMariSession = function() {
-            localStorage.removeItem('mari_session_id');
-            localStorage.removeItem('mari_affection_level');
-            localStorage.removeItem('mari_relationship_stage');
-            console.log("Session cleared");
-        };
-    });
-    </script>
-    """)
 
 # Gradioインターフェースをマウント
 # UIパスのみにマウント（"/"は削除）
@@ -0,0 +1,218 @@
+// 麻理チャットのセッション管理スクリプト
+// （app.py に埋め込んでいたものを分離し、ブラウザにキャッシュさせる）
+// window.API_BASE_URL などの接続先は app.py 側のインラインスクリプトで設定する
+
+// URLパスを結合する関数（二重スラッシュを防ぐ）
+window.joinPaths = function(base, path) {
+    // nullやundefinedのチェック
+    if (!base) return path || '';
+    if (!path) return base || '';
+
+    // 文字列に変換
+    base = String(base);
+    path = String(path);
+
+    // 末尾のスラッシュを削除
+    while (base.endsWith('/')) {
+        base = base.slice(0, -1);
+    }
+
+    // 先頭のスラッシュを削除
+    while (path.startsWith('/')) {
+        path = path.slice(1);
+    }
+
+    // 空の場合の処理
+    if (base === '' && path === '') return '/';
+    if (base === '') return '/' + path;
+    if (path === '') return base;
+
+    return base + '/' + path;
+};
+
+// Enhanced session management with localStorage
+window.mariSessionManager = {
+    // Save all session data to localStorage
+    saveSessionData: function(sessionId, affectionLevel, relationshipStage) {
+        if (sessionId) {
+            localStorage.setItem('mari_session_id', sessionId);
+
+            if (affectionLevel !== undefined) {
+                localStorage.setItem('mari_affection_level', affectionLevel);
+            }
+
+            if (relationshipStage !== undefined) {
+                localStorage.setItem('mari_relationship_stage', relationshipStage);
+            }
+
+            localStorage.setItem('mari_last_interaction', new Date().toISOString());
+            console.log('Saved session data to localStorage:', { 
+                sessionId, 
+                affectionLevel, 
+                relationshipStage,
+                timestamp: new Date().toISOString()
+            });
+            return true;
+        }
+        return false;
+    },
+
+    // Clear all session data from localStorage
+    clearSessionData: function() {
+        localStorage.removeItem('mari_session_id');
+        localStorage.removeItem('mari_affection_level');
+        localStorage.removeItem('mari_relationship_stage');
+        localStorage.removeItem('mari_last_interaction');
+        console.log('Cleared all session data from localStorage');
+    },
+
+    // Check if session is expired (older than 30 days)
+    isSessionExpired: function() {
+        const lastInteraction = localStorage.getItem('mari_last_interaction');
+        if (!lastInteraction) return true;
+
+        const lastDate = new Date(lastInteraction);
+        const now = new Date();
+        const daysDiff = (now - lastDate) / (1000 * 60 * 60 * 24);
+
+        return daysDiff > 30;
+    }
+};
+
+// Store session ID in localStorage for persistence across page reloads
+window.addEventListener('load', function() {
+    const storedSessionId = localStorage.getItem('mari_session_id');
+
+    // Check if we have a stored session and it's not expired
+    if (storedSessionId && !window.mariSessionManager.isSessionExpired()) {
+        console.log('Restored session ID from localStorage:', storedSessionId);
+
+        // We'll update the session_state component after the page loads
+        setTimeout(() => {
+            // Find the hidden session state component and update it
+            const sessionStateComponents = document.querySelectorAll('input[data-testid]');
+            for (const component of sessionStateComponents) {
+                if (component.parentElement.textContent.includes('session_state')) {
+                    component.value = storedSessionId;
+
+                    // Create and dispatch change event to notify Gradio
+                    const event = new Event('input', { bubbles: true });
+                    component.dispatchEvent(event);
+
+                    console.log('Updated session state component with stored ID:', storedSessionId);
+
+                    // Trigger session restoration
+                    window.dispatchEvent(new CustomEvent('mari_restore_session', {
+                        detail: { 
+                            sessionId: storedSessionId,
+                            affectionLevel: localStorage.getItem('mari_affection_level'),
+                            relationshipStage: localStorage.getItem('mari_relationship_stage')
+                        }
+                    }));
+                    break;
+                }
+            }
+        }, 1000);
+    } else if (storedSessionId && window.mariSessionManager.isSessionExpired()) {
+        // Clear expired session data
+        console.log('Found expired session, clearing data');
+        window.mariSessionManager.clearSessionData();
+    }
+});
+
+// Periodically update last interaction time while the page is open
+setInterval(function() {
+    const sessionId = localStorage.getItem('mari_session_id');
+    if (sessionId) {
+        localStorage.setItem('mari_last_interaction', new Date().toISOString());
+    }
+}, 60000); // Update every minute
+
+// Handle stage change notifications
+document.addEventListener('DOMContentLoaded', function() {
+    // Set up a mutation observer to watch for changes to the stage notification
+    const observer = new MutationObserver(function(mutations) {
+        mutations.forEach(function(mutation) {
+            if (mutation.type === 'childList') {
+                const stageNotification = document.querySelector('.stage-change-notification');
+                if (stageNotification) {
+                    // If content is empty, hide the notification
+                    if (!stageNotification.textContent || stageNotification.textContent.trim() === '') {
+                        stageNotification.style.display = 'none';
+                    } else {
+                        // Show notification with animation
+                        stageNotification.style.display = 'block';
+                        // Reset animation
+                        stageNotification.style.animation = 'none';
+                        stageNotification.offsetHeight; // Trigger reflow
+                        stageNotification.style.animation = 'fadeInOut 5s ease-in-out forwards';
+
+                        // Hide after animation completes
+                        setTimeout(function() {
+                            stageNotification.style.display = 'none';
+                        }, 5000);
+                    }
+                }
+            }
+        });
+    });
+
+    // Start observing the stage notification element
+    const stageNotificationElement = document.querySelector('.stage-change-notification');
+    if (stageNotificationElement) {
+        observer.observe(stageNotificationElement, { childList: true, subtree: true });
+    }
+});
+
+// セッション復元のための処理
+document.addEventListener('DOMContentLoaded', function() {
+    console.log("DOM loaded, initializing session restoration...");
+
+    // セッション復元関数
+    function restoreSession() {
+        const storedSessionId = localStorage.getItem('mari_session_id');
+        const affectionLevel = localStorage.getItem('mari_affection_level');
+        const relationshipStage = localStorage.getItem('mari_relationship_stage');
+
+        if (storedSessionId) {
+            console.log("Attempting to restore session:", storedSessionId);
+            console.log("Affection level:", affectionLevel);
+            console.log("Relationship stage:", relationshipStage);
+
+            // カスタムイベントを発行
+            window.dispatchEvent(new CustomEvent('mari_restore_session', {
+                detail: { 
+                    sessionId: storedSessionId,
+                    affectionLevel: affectionLevel || '0',
+                    relationshipStage: relationshipStage || 'stranger'
+                }
+            }));
+
+            return true;
+        } else {
+            console.log("No stored session found, creating new session");
+            return false;
+        }
+    }
+
+    // 1.5秒後にセッション復元を試行
+    setTimeout(function() {
+        restoreSession();
+    }, 1500);
+
+    // セッション保存関数（他の場所から呼び出し可能）
+    window.saveMariSession = function(sessionId, affectionLevel, relationshipStage) {
+        localStorage.setItem('mari_session_id', sessionId);
+        localStorage.setItem('mari_affection_level', affectionLevel);
+        localStorage.setItem('mari_relationship_stage', relationshipStage);
+        console.log("Session saved:", sessionId);
+    };
+
+    // セッションクリア関数
+    window.clearMariSession = function() {
+        localStorage.removeItem('mari_session_id');
+        localStorage.removeItem('mari_affection_level');
+        localStorage.removeItem('mari_relationship_stage');
+        console.log("Session cleared");
+    };
+});
@@ -18,6 +18,10 @@ class PromptGenerator:
         """
         self.base_prompt = base_prompt
         self.relationship_templates = self._load_relationship_templates()
+        # The prompt depends only on the relationship stage, so build each one once
+        self._stage_prompts = {
+            stage: self._build_stage_prompt(stage) for stage in self.relationship_templates
+        }
         
     def _load_relationship_templates(self) -> Dict[str, str]:
         """
@@ -121,6 +125,22 @@ class PromptGenerator:
         # Get relationship stage based on affection level
         stage = self.get_relationship_stage(affection_level)
         
+        # Prompts are prebuilt per stage; the same string object is reused every turn
+        prompt = self._stage_prompts.get(stage)
+        if prompt is None:
+            prompt = self._stage_prompts[stage] = self._build_stage_prompt(stage)
+        return prompt
+    
+    def _build_stage_prompt(self, stage: str) -> str:
+        """
+        Build the system prompt for a relationship stage
+        
+        Args:
+            stage: Relationship stage name
+            
+        Returns:
+            Base prompt with its relationship section replaced by the stage template
+        """
         # Get template for this stage
         template = self.relationship_templates.get(stage, "")
         
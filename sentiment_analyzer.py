@@ -21,9 +21,9 @@ class SentimentType(Enum):
     SEXUAL = "sexual"  # 性的内容の検出タイプ
     INTEREST = "interest"  # 麻理の興味関心に関する検出タイプ（新規追加）
 
-@dataclass
+@dataclass(frozen=True)
 class SentimentAnalysisResult:
-    """Result of sentiment analysis on user input"""
+    """Result of sentiment analysis on user input (immutable, so results can be cached)"""
     sentiment_score: float  # -1.0 to 1.0
     interaction_type: str
     affection_delta: int  # -10 to +10
@@ -468,14 +468,10 @@ class SentimentAnalyzer:
         Returns:
             Tuple of (total_score, found_keywords)
         """
-        total_score = 0
-        found_keywords = []
-        
-        for keyword, weight in keyword_dict.items():
-            # 完全一致または部分一致を検出（日本語は単語区切りが難しいため部分一致で）
-            if keyword in text:
-                total_score += weight
-                found_keywords.append(keyword)
+        # 完全一致または部分一致を検出（日本語は単語区切りが難しいため部分一致で）
+        # ループ内では部分一致の判定だけを行い、重みの合計はヒットしたキーワード分だけ計算する
+        found_keywords = [keyword for keyword in keyword_dict if keyword in text]
+        total_score = sum(keyword_dict[keyword] for keyword in found_keywords)
         
         return total_score, found_keywords
     
@@ -5,12 +5,68 @@ Handles file-based session persistence, serialization, and deserialization
 
 import os
 import json
+import mmap
+import atexit
+import threading
 import shutil
 import logging
-from typing import Dict, List, Optional, Any
+from typing import IO, Dict, List, Optional, Any, Tuple, Union
+import heapq
+from operator import itemgetter
 from datetime import datetime, timedelta
 from dataclasses import dataclass, asdict
 
+# orjson is much faster than the stdlib json module; fall back to json if missing
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize an object to UTF-8 JSON bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def _loads(data: Union[bytes, memoryview]) -> Any:
+    """Deserialize UTF-8 JSON bytes (raises json.JSONDecodeError on bad input)"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+def _sync_file(f: IO[bytes]) -> None:
+    """Flush a file's data to disk (fdatasync where available)"""
+    f.flush()
+    if hasattr(os, "fdatasync"):
+        os.fdatasync(f.fileno())
+    else:
+        os.fsync(f.fileno())
+
+def _load_file(file_path: str) -> Any:
+    """
+    Deserialize a JSON file through a read-only memory map
+    
+    The parser reads straight from the mapped pages, so no intermediate copy
+    of the file contents is made.
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return _loads(b"")  # mmap cannot map empty files; raises JSONDecodeError
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                return _loads(view)
+
+# File (inside the storage directory) holding the session index
+INDEX_FILENAME = "sessions.idx"
+
+# Number of delta records after which a session log is compacted into a full snapshot
+DELTA_COMPACT_THRESHOLD = 64
+
 @dataclass
 class UserSession:
     """Data structure for tracking user session information"""
@@ -23,6 +79,36 @@ class UserSession:
     stage_transitions: List[Dict[str, Any]] = None  # 段階変化の履歴
     engagement_metrics: Dict[str, Any] = None  # エンゲージメント指標
     
+    @property
+    def last_interaction_dt(self) -> datetime:
+        """
+        Parsed last_interaction timestamp
+        
+        The parse is cached against the source string, so it is redone only
+        after last_interaction changes.
+        """
+        cached = self.__dict__.get('_last_interaction_cache')
+        if cached is None or cached[0] != self.last_interaction:
+            cached = (self.last_interaction, datetime.fromisoformat(self.last_interaction))
+            self.__dict__['_last_interaction_cache'] = cached
+        return cached[1]
+    
+    def touch(self, now: Optional[datetime] = None) -> datetime:
+        """
+        Record an interaction, keeping the parsed timestamp alongside the string
+        
+        Args:
+            now: Interaction time (default: current time)
+            
+        Returns:
+            The interaction time
+        """
+        if now is None:
+            now = datetime.now()
+        self.last_interaction = now.isoformat()
+        self.__dict__['_last_interaction_cache'] = (self.last_interaction, now)
+        return now
+    
     def to_dict(self) -> Dict[str, Any]:
         """Convert session to dictionary for JSON serialization"""
         return asdict(self)
@@ -43,7 +129,13 @@ class SessionStorage:
             storage_dir: Directory path for storing session files
         """
         self.storage_dir = storage_dir
+        self._delta_counts: Dict[str, int] = {}  # Delta records not yet folded into a snapshot
+        # Session index {session_id: [last_interaction, affection_level]}, loaded on first use
+        self._index: Optional[Dict[str, List[Any]]] = None
+        self._index_dirty = False
+        self._index_lock = threading.RLock()
         self._ensure_storage_dir()
+        atexit.register(self.flush_index)
     
     def _ensure_storage_dir(self) -> None:
         """Create storage directory if it doesn't exist"""
@@ -71,8 +163,22 @@ class SessionStorage:
         
         try:
             file_path = os.path.join(self.storage_dir, f"{session.user_id}.json")
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(session.to_dict(), f, ensure_ascii=False, indent=2)
+            
+            # Write to a temporary file, flush its contents to disk and rename it
+            # into place, so neither a crash nor a power loss can leave a truncated
+            # or empty snapshot behind. The rename itself is made durable by
+            # sync_directory(), once per batch of saves.
+            tmp_path = file_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(_dumps(session.to_dict(), indent=True))
+                _sync_file(f)
+            os.replace(tmp_path, file_path)
+            
+            # The snapshot now contains every delta, so the log can be discarded
+            self._remove_delta_log(session.user_id)
+            
+            # The index file is written in batches by flush_index() (and at exit)
+            self._update_index(session.user_id, session.last_interaction, session.affection_level)
             
             logging.debug(f"Session {session.user_id} saved to {file_path}")
             return True
@@ -98,10 +204,12 @@ class SessionStorage:
                 logging.debug(f"Session file not found: {file_path}")
                 return None
             
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = _load_file(file_path)
             
             session = UserSession.from_dict(data)
+            if not self._replay_deltas(session):
+                # Fold the readable records into a fresh snapshot and drop the damaged log
+                self.save_session(session)
             logging.debug(f"Session {session_id} loaded from {file_path}")
             return session
         
@@ -120,6 +228,326 @@ class SessionStorage:
             self._backup_corrupted_file(file_path)
             return None
     
+    def _delta_path(self, session_id: str) -> str:
+        """Path of the append-only delta log for a session"""
+        return os.path.join(self.storage_dir, f"{session_id}.log")
+    
+    def append_delta(self, session_id: str, record: Dict[str, Any]) -> bool:
+        """
+        Append a change record to the session's delta log
+        
+        Records hold absolute field values (not increments), one JSON object per
+        line. Every record must carry ``last_interaction``; optional keys are
+        ``affection_level`` and ``turn`` (a conversation entry to append, with
+        ``keep`` to retain only the last N entries).
+        
+        Args:
+            session_id: ID of the session the record belongs to
+            record: Change record to append
+            
+        Returns:
+            bool: True if the record was written, False otherwise
+        """
+        try:
+            line = _dumps(record)
+            with open(self._delta_path(session_id), 'ab') as f:
+                f.write(line + b"\n")
+            
+            self._delta_counts[session_id] = self._delta_counts.get(session_id, 0) + 1
+            self._update_index(session_id, record.get("last_interaction"), record.get("affection_level"))
+            return True
+        
+        except (IOError, OSError, TypeError, ValueError) as e:
+            logging.error(f"Failed to append delta for session {session_id}: {str(e)}")
+            return False
+    
+    def needs_compaction(self, session_id: str) -> bool:
+        """
+        Check whether a session's delta log should be folded into a snapshot
+        
+        Args:
+            session_id: ID of the session
+            
+        Returns:
+            bool: True if the log holds at least DELTA_COMPACT_THRESHOLD records
+        """
+        return self._delta_counts.get(session_id, 0) >= DELTA_COMPACT_THRESHOLD
+    
+    def _replay_deltas(self, session: UserSession) -> bool:
+        """
+        Apply the records of a session's delta log on top of its snapshot
+        
+        Records that are not newer than the snapshot (left behind if the process
+        stopped between writing a snapshot and removing the log) are skipped, and
+        a partially written last line is ignored.
+        
+        Args:
+            session: Session loaded from its snapshot, updated in place
+            
+        Returns:
+            bool: False if the log had a damaged record, True otherwise
+        """
+        delta_path = self._delta_path(session.user_id)
+        if not os.path.exists(delta_path):
+            return True
+        
+        snapshot_time = session.last_interaction
+        count = 0
+        intact = True
+        try:
+            with open(delta_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = _loads(line)
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        logging.warning(f"Ignoring truncated delta record for session {session.user_id}")
+                        intact = False
+                        break
+                    if record.get("last_interaction", "") <= snapshot_time:
+                        continue
+                    self._apply_delta(session, record)
+                    count += 1
+        
+        except (IOError, OSError) as e:
+            logging.error(f"Failed to replay deltas for session {session.user_id}: {str(e)}")
+        
+        self._delta_counts[session.user_id] = count
+        return intact
+    
+    @staticmethod
+    def _apply_delta(session: UserSession, record: Dict[str, Any]) -> None:
+        """Apply a single delta record to a session"""
+        if "affection_level" in record:
+            session.affection_level = record["affection_level"]
+        
+        turn = record.get("turn")
+        if turn is not None:
+            session.conversation_history.append(turn)
+            keep = record.get("keep")
+            if keep and len(session.conversation_history) > keep:
+                session.conversation_history = session.conversation_history[-keep:]
+        
+        if "last_interaction" in record:
+            session.last_interaction = record["last_interaction"]
+    
+    def _remove_delta_log(self, session_id: str) -> None:
+        """Remove a session's delta log if it exists"""
+        self._delta_counts.pop(session_id, None)
+        try:
+            os.remove(self._delta_path(session_id))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Failed to remove delta log for session {session_id}: {str(e)}")
+    
+    def _index_path(self) -> str:
+        """Path of the session index file"""
+        return os.path.join(self.storage_dir, INDEX_FILENAME)
+    
+    def get_index(self) -> Dict[str, List[Any]]:
+        """
+        Get the session index, loading or rebuilding it on first use
+        
+        The index maps each session ID to ``[last_interaction, affection_level]``
+        so callers can list sessions without decoding every session file. It is
+        kept current in memory and written to disk by flush_index() after each
+        batch of snapshots and at exit; if the file is missing or unreadable it
+        is rebuilt from the session files.
+        
+        A loaded index may be stale if the process stopped before flushing it,
+        so it is reconciled with the session files on first use.
+        
+        Returns:
+            Dictionary mapping session IDs to [last_interaction, affection_level]
+        """
+        with self._index_lock:
+            if self._index is None:
+                try:
+                    self._index = self._reconcile_index(_load_file(self._index_path()))
+                except FileNotFoundError:
+                    self._index = self._rebuild_index()
+                except (IOError, OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
+                    logging.warning(f"Session index unreadable, rebuilding: {str(e)}")
+                    self._index = self._rebuild_index()
+            return self._index
+    
+    def _read_index_entry(self, session_id: str) -> Optional[List[Any]]:
+        """
+        Read a session's index entry from its snapshot and delta log
+        
+        Args:
+            session_id: ID of the session
+            
+        Returns:
+            [last_interaction, affection_level], or None if the session is unreadable
+        """
+        try:
+            data = _load_file(os.path.join(self.storage_dir, f"{session_id}.json"))
+            if os.path.exists(self._delta_path(session_id)):
+                # Pending deltas must be applied to get current values
+                session = UserSession.from_dict(data)
+                self._replay_deltas(session)
+                data = session.to_dict()
+        except (IOError, OSError, json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+            return None
+        
+        last_interaction = data.get("last_interaction") if isinstance(data, dict) else None
+        if isinstance(last_interaction, str) and last_interaction:
+            return [last_interaction, data.get("affection_level")]
+        return None
+    
+    def _rebuild_index(self) -> Dict[str, List[Any]]:
+        """
+        Build the session index by scanning the session files
+        
+        Returns:
+            Dictionary mapping session IDs to [last_interaction, affection_level]
+        """
+        index = {}
+        for session_id in self.list_sessions():
+            entry = self._read_index_entry(session_id)
+            if entry is not None:
+                index[session_id] = entry
+        
+        self._index_dirty = True
+        logging.info(f"Rebuilt session index with {len(index)} sessions")
+        return index
+    
+    def _reconcile_index(self, index: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+        """
+        Bring an index loaded from disk in line with the session files
+        
+        Sessions missing from the index are added, entries whose snapshot is
+        gone are dropped, and sessions with a delta log are re-read, since
+        their latest values may never have reached the index file.
+        
+        Args:
+            index: Index as loaded from disk
+            
+        Returns:
+            The reconciled index
+        """
+        try:
+            filenames = os.listdir(self.storage_dir)
+        except OSError as e:
+            logging.error(f"Failed to list sessions: {str(e)}")
+            return index
+        
+        session_ids = {name[:-5] for name in filenames if name.endswith('.json')}
+        logged_ids = {name[:-4] for name in filenames if name.endswith('.log')}
+        
+        changed = 0
+        for session_id in [s for s in index if s not in session_ids]:
+            del index[session_id]
+            changed += 1
+        
+        for session_id in session_ids:
+            if session_id in index and session_id not in logged_ids:
+                continue
+            entry = self._read_index_entry(session_id)
+            if entry is None:
+                if index.pop(session_id, None) is not None:
+                    changed += 1
+            elif index.get(session_id) != entry:
+                index[session_id] = entry
+                changed += 1
+        
+        if changed:
+            self._index_dirty = True
+            logging.info(f"Reconciled session index: {changed} entries updated")
+        return index
+    
+    def _update_index(self, session_id: str, last_interaction: Optional[str] = None,
+                      affection_level: Optional[int] = None) -> None:
+        """Update a session's index entry in memory"""
+        with self._index_lock:
+            index = self.get_index()
+            entry = index.get(session_id, [None, None])
+            if last_interaction is not None:
+                entry[0] = last_interaction
+            if affection_level is not None:
+                entry[1] = affection_level
+            index[session_id] = entry
+            self._index_dirty = True
+    
+    def flush_index(self) -> bool:
+        """
+        Write the session index to disk if it has changed
+        
+        The file is written to a temporary path and renamed into place so
+        readers never see a partial index.
+        
+        Returns:
+            bool: True if the index is on disk and current, False otherwise
+        """
+        with self._index_lock:
+            if self._index is None or not self._index_dirty:
+                return True
+            
+            tmp_path = self._index_path() + ".tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(_dumps(self._index))
+                os.replace(tmp_path, self._index_path())
+                self._index_dirty = False
+                return True
+            
+            except (IOError, OSError, TypeError) as e:
+                logging.error(f"Failed to write session index: {str(e)}")
+                return False
+    
+    def sync_directory(self) -> bool:
+        """
+        fsync the storage directory so completed renames survive a crash
+        
+        Returns:
+            bool: True if the directory was synced, False if unsupported or failed
+        """
+        if not hasattr(os, "O_DIRECTORY"):
+            return False  # e.g. Windows, where directories cannot be opened
+        
+        try:
+            dir_fd = os.open(self.storage_dir, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            return True
+        
+        except OSError as e:
+            logging.warning(f"Failed to sync session directory: {str(e)}")
+            return False
+    
+    def _history_archive_path(self, session_id: str) -> str:
+        """Path of the cold-storage archive for trimmed conversation turns"""
+        return os.path.join(self.storage_dir, f"{session_id}.history.jsonl")
+    
+    def archive_history(self, session_id: str, entries: List[Dict[str, Any]]) -> bool:
+        """
+        Append conversation turns dropped from the live history to the session's archive
+        
+        The archive is write-only from the app's point of view; it keeps the
+        full transcript without making snapshots grow with session length.
+        
+        Args:
+            session_id: ID of the session the turns belong to
+            entries: Conversation entries, oldest first
+            
+        Returns:
+            bool: True if the entries were written, False otherwise
+        """
+        if not entries:
+            return True
+        
+        try:
+            with open(self._history_archive_path(session_id), 'ab') as f:
+                f.write(b"".join(_dumps(entry) + b"\n" for entry in entries))
+            return True
+        
+        except (IOError, OSError, TypeError, ValueError) as e:
+            logging.error(f"Failed to archive history for session {session_id}: {str(e)}")
+            return False
+    
     def _backup_corrupted_file(self, file_path: str) -> None:
         """
         Create a backup of a corrupted session file
@@ -156,6 +584,14 @@ class SessionStorage:
                 return False
             
             os.remove(file_path)
+            self._remove_delta_log(session_id)
+            with self._index_lock:
+                if self.get_index().pop(session_id, None) is not None:
+                    self._index_dirty = True
+                    self.flush_index()
+            archive_path = self._history_archive_path(session_id)
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
             logging.info(f"Deleted session file: {file_path}")
             return True
         
@@ -181,6 +617,29 @@ class SessionStorage:
             logging.error(f"Failed to list sessions: {str(e)}")
             return []
     
+    def list_sessions_with_last_interaction(self, limit: Optional[int] = None) -> List[Tuple[str, str]]:
+        """
+        List session IDs together with their last interaction timestamp
+        
+        Served from the session index, without opening the session files.
+        
+        Args:
+            limit: Maximum number of entries to return (most recent first)
+            
+        Returns:
+            List of (session_id, iso_timestamp) tuples
+        """
+        with self._index_lock:
+            results = [
+                (session_id, entry[0])
+                for session_id, entry in self.get_index().items()
+                if entry[0]
+            ]
+        
+        if limit is not None:
+            results = heapq.nlargest(limit, results, key=itemgetter(1))
+        return results
+    
     def cleanup_old_sessions(self, days_old: int = 30) -> int:
         """
         Clean up sessions older than specified days
@@ -201,7 +660,7 @@ class SessionStorage:
                     continue
                 
                 try:
-                    last_interaction = datetime.fromisoformat(session.last_interaction)
+                    last_interaction = session.last_interaction_dt
                     days_since_interaction = (current_time - last_interaction).days
                     
                     if days_since_interaction > days_old:
@@ -250,7 +709,7 @@ class SessionStorage:
                     continue
                 
                 try:
-                    last_interaction = datetime.fromisoformat(session.last_interaction)
+                    last_interaction = session.last_interaction_dt
                     days_since_interaction = (current_time - last_interaction).days
                     
                     if days_since_interaction <= 30:  # Consider active if used in last 30 days
@@ -4,9 +4,10 @@
 
 import os
 import sys
-import json
 from pathlib import Path
 
+from session_storage import SessionStorage
+
 def set_affection_level(session_id, new_level):
     """
     指定されたセッションの好感度レベルを設定する
@@ -18,34 +19,29 @@ def set_affection_level(session_id, new_level):
     Returns:
         bool: 成功したかどうか
     """
-    # セッションディレクトリのパスを取得
-    sessions_dir = Path("sessions")
-    
-    # セッションファイルのパスを構築
-    session_file = sessions_dir / f"{session_id}.json"
+    # 差分ログも反映されるよう、セッションストレージ経由で読み書きする
+    storage = SessionStorage("sessions")
     
-    # ファイルが存在するか確認
-    if not session_file.exists():
-        print(f"エラー: セッションファイル {session_file} が見つかりません")
+    # セッションが存在するか確認
+    session = storage.load_session(session_id)
+    if not session:
+        print(f"エラー: セッション {session_id} が見つかりません")
         return False
     
     try:
-        # セッションファイルを読み込む
-        with open(session_file, "r", encoding="utf-8") as f:
-            session_data = json.load(f)
-        
         # 現在の好感度を表示
-        old_level = session_data.get("affection_level", 0)
+        old_level = session.affection_level
         print(f"現在の好感度: {old_level}")
         
         # 好感度を更新
-        session_data["affection_level"] = max(0, min(100, int(new_level)))
+        session.affection_level = max(0, min(100, int(new_level)))
         
-        # 更新したデータを保存
-        with open(session_file, "w", encoding="utf-8") as f:
-            json.dump(session_data, f, ensure_ascii=False, indent=2)
+        # 更新したデータを保存（差分ログはスナップショットに統合される）
+        if not storage.save_session(session):
+            print("エラー: セッションの保存に失敗しました")
+            return False
         
-        print(f"好感度を {old_level} から {session_data['affection_level']} に更新しました")
+        print(f"好感度を {old_level} から {session.affection_level} に更新しました")
         return True
     
     except Exception as e:
@@ -66,15 +62,14 @@ def list_sessions():
         print("セッションファイルが見つかりません")
         return
     
+    storage = SessionStorage("sessions")
+    
     print("利用可能なセッション:")
     for session_file in session_files:
         session_id = session_file.stem
         try:
-            with open(session_file, "r", encoding="utf-8") as f:
-                session_data = json.load(f)
-                affection = session_data.get("affection_level", "不明")
-                last_interaction = session_data.get("last_interaction", "不明")
-                print(f"セッションID: {session_id}, 好感度: {affection}, 最終更新: {last_interaction}")
+            session = storage.load_session(session_id)
+            print(f"セッションID: {session_id}, 好感度: {session.affection_level}, 最終更新: {session.last_interaction}")
         except:
             print(f"セッションID: {session_id}, データ読み込みエラー")
 
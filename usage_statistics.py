@@ -4,9 +4,11 @@ Collects and analyzes user session data for statistical insights
 """
 
 import os
+import io
+import csv
 import json
 import logging
-from typing import Dict, List, Any, Optional
+from typing import IO, Dict, List, Any, Optional
 from datetime import datetime, timedelta
 import calendar
 
@@ -166,7 +168,7 @@ class UsageStatistics:
             days: Number of days to include
             
         Returns:
-            Dictionary mapping dates to unique user counts
+            Dictionary mapping dates to unique user counts, ordered by ascending date
         """
         try:
             stats = self._load_stats()
@@ -175,13 +177,16 @@ class UsageStatistics:
             end_date = datetime.now()
             start_date = end_date - timedelta(days=days)
             
-            # Filter daily users within date range
+            # Filter daily users within date range. "YYYY-MM-DD" keys sort
+            # chronologically, and they are normally stored in that order
+            # already, so this sort is close to linear.
+            daily_data = stats["daily_users"]
             daily_users = {}
-            for date_str, data in stats["daily_users"].items():
+            for date_str in sorted(daily_data):
                 try:
                     date = datetime.strptime(date_str, "%Y-%m-%d")
                     if start_date <= date <= end_date:
-                        daily_users[date_str] = data["count"]
+                        daily_users[date_str] = daily_data[date_str]["count"]
                 except ValueError:
                     continue
             
@@ -311,50 +316,77 @@ class UsageStatistics:
                 "error": str(e)
             }
     
-    def export_data_csv(self, start_date: str = None, end_date: str = None) -> str:
+    def export_data_csv_to(self, start_date: str = None, end_date: str = None,
+                           file_obj: IO[str] = None, chunk_rows: int = 10_000) -> bool:
         """
-        Export statistics data as CSV
+        Stream statistics data as CSV into an open text file
+        
+        Rows are buffered and written in chunks so the whole export is never
+        held in memory as a single string.
         
         Args:
             start_date: Start date in format "YYYY-MM-DD" (default: 30 days ago)
             end_date: End date in format "YYYY-MM-DD" (default: today)
+            file_obj: Writable text file (open it with newline="")
+            chunk_rows: Number of rows to buffer before each write
             
         Returns:
-            CSV data as string
+            True if the export succeeded
         """
         try:
             # Default date range
             if not end_date:
                 end_date_obj = datetime.now()
-                end_date = end_date_obj.strftime("%Y-%m-%d")
             else:
                 end_date_obj = datetime.strptime(end_date, "%Y-%m-%d")
                 
             if not start_date:
                 start_date_obj = end_date_obj - timedelta(days=30)
-                start_date = start_date_obj.strftime("%Y-%m-%d")
             else:
                 start_date_obj = datetime.strptime(start_date, "%Y-%m-%d")
             
             # Load stats
-            stats = self._load_stats()
+            daily_users = self._load_stats()["daily_users"]
             
-            # Prepare CSV data
-            csv_lines = ["date,unique_users"]
+            writer = csv.writer(file_obj, lineterminator="\n")
+            writer.writerow(("date", "unique_users"))
             
             # Generate date range
+            rows = []
             current_date = start_date_obj
             while current_date <= end_date_obj:
                 date_str = current_date.strftime("%Y-%m-%d")
-                user_count = stats["daily_users"].get(date_str, {}).get("count", 0)
-                csv_lines.append(f"{date_str},{user_count}")
+                rows.append((date_str, daily_users.get(date_str, {}).get("count", 0)))
+                if len(rows) >= chunk_rows:
+                    writer.writerows(rows)
+                    rows.clear()
                 current_date += timedelta(days=1)
             
-            return "\n".join(csv_lines)
+            if rows:
+                writer.writerows(rows)
+            
+            return True
             
         except Exception as e:
             logging.error(f"Failed to export data as CSV: {str(e)}")
+            return False
+    
+    def export_data_csv(self, start_date: str = None, end_date: str = None) -> str:
+        """
+        Export statistics data as CSV
+        
+        Args:
+            start_date: Start date in format "YYYY-MM-DD" (default: 30 days ago)
+            end_date: End date in format "YYYY-MM-DD" (default: today)
+            
+        Returns:
+            CSV data as string
+        """
+        buffer = io.StringIO()
+        if not self.export_data_csv_to(start_date, end_date, buffer):
             return "Error exporting data"
+        
+        return buffer.getvalue().rstrip("\n")
 
 # Global instance
 usage_stats = None